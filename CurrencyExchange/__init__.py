@@ -1,3 +1,9 @@
-from .celery import app as celery_app
-
 __all__ = ('celery_app',)
+
+
+def __getattr__(name):
+    # Celery is loaded on first use (by workers and by code sending tasks), keeping it out of web worker startup
+    if name == 'celery_app':
+        from .celery import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
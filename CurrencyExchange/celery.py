@@ -1,6 +1,8 @@
 import os
+from billiard.process import current_process
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CurrencyExchange.settings')
 
@@ -18,8 +20,30 @@ app.conf.beat_schedule = {
         'task': 'exchange_app.tasks.scheduled_historical_exchange_rates',
         'schedule': crontab(hour=0, minute=30),  # Runs at midnight 00:30
     },
+    'prewarm-rate-caches-daily': {
+        'task': 'exchange_app.tasks.prewarm_rate_caches',
+        'schedule': crontab(hour=1, minute=0),  # Runs at 01:00, after the midnight ingest
+    },
+    'compact-old-exchange-rates-weekly': {
+        'task': 'exchange_app.tasks.compact_old_exchange_rates',
+        'schedule': crontab(hour=2, minute=0, day_of_week='sunday'),  # Runs on Sundays at 02:00
+    },
 }
 
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
+
+
+@worker_process_init.connect
+def start_worker_metrics_server(**kwargs):
+    """
+    Exposes ingest and provider metrics of each worker process on its own port.
+    """
+    from django.conf import settings
+
+    if settings.METRICS_WORKER_PORT is None:
+        return
+
+    from exchange_app.metrics import start_http_server
+    start_http_server(settings.METRICS_WORKER_PORT + (getattr(current_process(), 'index', 0) or 0))
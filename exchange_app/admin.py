@@ -1,5 +1,7 @@
 from django.contrib import admin
+from .aggregation import refresh_monthly_rollups
 from .models import Currency, ExchangeRate, Provider
+from .signals import reference_data_changed
 
 @admin.register(Currency)
 class CurrencyAdmin(admin.ModelAdmin):
@@ -19,6 +21,20 @@ class ExchangeRateAdmin(admin.ModelAdmin):
     search_fields = ('base_currency__code', 'target_currency__code')
     ordering = ('-date',)
 
+    # Edits bypass the ingest task, so the monthly statistics of the touched months are refreshed
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_monthly_rollups([obj.date, *([form.initial['date']] if change else [])])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_monthly_rollups([obj.date])
+
+    def delete_queryset(self, request, queryset):
+        dates = set(queryset.values_list('date', flat=True))
+        super().delete_queryset(request, queryset)
+        refresh_monthly_rollups(dates)
+
 @admin.register(Provider)
 class ProviderAdmin(admin.ModelAdmin):
     """
@@ -32,8 +48,10 @@ class ProviderAdmin(admin.ModelAdmin):
 
     def activate_providers(self, request, queryset):
         queryset.update(is_active=True)
+        reference_data_changed.send(sender=Provider)  # queryset.update sends no model signals
     activate_providers.short_description = "Activate selected providers"
 
     def deactivate_providers(self, request, queryset):
         queryset.update(is_active=False)
+        reference_data_changed.send(sender=Provider)  # queryset.update sends no model signals
     deactivate_providers.short_description = "Deactivate selected providers"
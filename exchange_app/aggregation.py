@@ -0,0 +1,293 @@
+import math
+from datetime import date, timedelta
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Max, Min, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from .models import ExchangeRate, MonthlyRateRollup, MonthlyRollupLock, PackedRateBlock
+from .packing import decode_rates, packed_rates
+
+BUCKETS = ('day', 'week', 'month')
+
+ROLLUP_FIELDS = ['count', 'min_rate', 'max_rate', 'first_rate', 'last_rate', 'sum_rate', 'sum_squares']
+
+SQUARED_RATE = ExpressionWrapper(F('rate') * F('rate'), output_field=FloatField())
+
+
+def month_start(value):
+    return value.replace(day=1)
+
+
+def next_month(value):
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def period_start(day, bucket):
+    """
+    Start of the day/week (ISO, Monday)/month bucket containing `day`, matching the database truncation.
+    """
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return month_start(day)
+    return day
+
+
+# Bucket statistics are kept as count/sum/sum of squares so that statistics from
+# the database, the rollups and packed blocks can be merged before the mean and
+# standard deviation are derived.
+
+def _row_stats(day, rate):
+    return {'count': 1, 'min': rate, 'max': rate, 'first_date': day, 'first': rate, 'last_date': day, 'last': rate,
+            'sum': float(rate), 'sum_squares': float(rate) ** 2}
+
+
+def _merge_stats(a, b):
+    if a is None:
+        return b
+    first = a if a['first_date'] <= b['first_date'] else b
+    last = a if a['last_date'] >= b['last_date'] else b
+    return {
+        'count': a['count'] + b['count'],
+        'min': min(a['min'], b['min']),
+        'max': max(a['max'], b['max']),
+        'first_date': first['first_date'],
+        'first': first['first'],
+        'last_date': last['last_date'],
+        'last': last['last'],
+        'sum': a['sum'] + b['sum'],
+        'sum_squares': a['sum_squares'] + b['sum_squares'],
+    }
+
+
+def _python_stats(rows):
+    """
+    Aggregates ((group key), date, rate) rows in Python, used for packed blocks.
+    """
+    stats = {}
+    for key, day, rate in rows:
+        stats[key] = _merge_stats(stats.get(key), _row_stats(day, rate))
+    return stats
+
+
+def _db_stats(queryset, group_fields, cell_fields):
+    """
+    Aggregates daily rows in the database. Only the first/last rate of each
+    group is fetched afterwards (one query), never the daily rows themselves.
+
+    :param queryset: ExchangeRate queryset, annotated with any grouping expression
+    :param group_fields: Fields to group by
+    :param cell_fields: Fields that, with the date, identify a single row of a group
+    :return: Dict of group key tuple to bucket statistics
+    """
+    rows = list(queryset.values(*group_fields).annotate(
+        count=Count('id'),
+        min=Min('rate'),
+        max=Max('rate'),
+        sum=Sum('rate'),
+        sum_squares=Sum(SQUARED_RATE),
+        first_date=Min('date'),
+        last_date=Max('date'),
+    ))
+    if not rows:
+        return {}
+
+    cells = {tuple(row[field] for field in cell_fields) + (row[key],) for row in rows
+             for key in ('first_date', 'last_date')}
+    rates = {
+        tuple(values[:-1]): values[-1]
+        for values in queryset.filter(date__in={cell[-1] for cell in cells}).values_list(*cell_fields, 'date', 'rate')
+    }
+
+    stats = {}
+    for row in rows:
+        cell = tuple(row[field] for field in cell_fields)
+        stats[tuple(row[field] for field in group_fields)] = {
+            'count': row['count'],
+            'min': row['min'],
+            'max': row['max'],
+            'first_date': row['first_date'],
+            'first': rates[cell + (row['first_date'],)],
+            'last_date': row['last_date'],
+            'last': rates[cell + (row['last_date'],)],
+            'sum': float(row['sum']),
+            'sum_squares': float(row['sum_squares']),
+        }
+    return stats
+
+
+def refresh_monthly_rollups(dates, base_currency_ids=None):
+    """
+    Recomputes the monthly rollups of every month containing one of `dates`,
+    from the daily rows and any packed (compacted) block of the month.
+
+    :param dates: Dates (or YYYY-MM-DD strings) whose months changed
+    :param base_currency_ids: Optionally restrict the refresh to these base currencies
+    :return: Number of rollup rows written
+    """
+    base_currency_ids = None if base_currency_ids is None else list(base_currency_ids)
+    months = sorted({month_start(date.fromisoformat(d) if isinstance(d, str) else d) for d in dates})
+    written = 0
+
+    for month in months:
+        with transaction.atomic():
+            # Parallel ingest tasks refresh a month one at a time, so the last refresh
+            # reads the rows every task committed before it instead of a stale subset
+            MonthlyRollupLock.objects.select_for_update().get_or_create(month=month)
+            written += _refresh_month(month, base_currency_ids)
+
+    return written
+
+
+def _refresh_month(month, base_currency_ids):
+    """
+    Recomputes the rollups of one month, called with the month locked.
+
+    :return: Number of rollup rows written
+    """
+    pair = ('base_currency_id', 'target_currency_id')
+    queryset = ExchangeRate.objects.filter(date__gte=month, date__lt=next_month(month))
+    blocks = PackedRateBlock.objects.filter(month=month)
+    if base_currency_ids is not None:
+        queryset = queryset.filter(base_currency_id__in=base_currency_ids)
+        blocks = blocks.filter(base_currency_id__in=base_currency_ids)
+
+    stats = _db_stats(queryset, pair, pair)
+
+    for block in blocks:
+        # Daily rows win over packed cells for the same day (late backfills)
+        daily = set(queryset.filter(base_currency_id=block.base_currency_id).values_list('target_currency_id', 'date'))
+        packed = _python_stats(
+            ((block.base_currency_id, target_currency_id), day, rate)
+            for target_currency_id, day, rate, _ in decode_rates(block.month, block.data)
+            if (target_currency_id, day) not in daily
+        )
+        for key, value in packed.items():
+            stats[key] = _merge_stats(stats.get(key), value)
+
+    # Pairs whose rates of the month were all deleted lose their rollup
+    rollups = MonthlyRateRollup.objects.filter(month=month)
+    if base_currency_ids is not None:
+        rollups = rollups.filter(base_currency_id__in=base_currency_ids)
+    stale = [rollup_id for rollup_id, *key in rollups.values_list('id', *pair) if tuple(key) not in stats]
+    if stale:
+        MonthlyRateRollup.objects.filter(id__in=stale).delete()
+
+    if not stats:
+        return 0
+
+    rollups = [
+        MonthlyRateRollup(
+            base_currency_id=base_currency_id,
+            target_currency_id=target_currency_id,
+            month=month,
+            count=value['count'],
+            min_rate=value['min'],
+            max_rate=value['max'],
+            first_rate=value['first'],
+            last_rate=value['last'],
+            sum_rate=value['sum'],
+            sum_squares=value['sum_squares'],
+        )
+        for (base_currency_id, target_currency_id), value in stats.items()
+    ]
+    MonthlyRateRollup.objects.bulk_create(
+        rollups, update_conflicts=True, unique_fields=['base_currency', 'target_currency', 'month'],
+        update_fields=ROLLUP_FIELDS)
+    return len(rollups)
+
+
+def _range_stats(base_currency_id, target_currency_ids, date_from, date_to, bucket):
+    """
+    Bucket statistics of a date range from daily rows (aggregated by the
+    database) merged with compacted rows from packed blocks.
+    """
+    queryset = ExchangeRate.objects.filter(base_currency_id=base_currency_id, date__range=[date_from, date_to])
+    if target_currency_ids:
+        queryset = queryset.filter(target_currency_id__in=target_currency_ids)
+
+    period = {'day': F('date'), 'week': TruncWeek('date'), 'month': TruncMonth('date')}[bucket]
+    stats = _db_stats(queryset.annotate(period_start=period), ('target_currency_id', 'period_start'),
+                      ('target_currency_id',))
+
+    packed = _python_stats(
+        ((target_currency_id, period_start(day, bucket)), day, rate)
+        for _, target_currency_id, day, rate, _ in packed_rates(date_from, date_to, target_currency_ids,
+                                                                base_currency_id=base_currency_id)
+    )
+    for key, value in packed.items():
+        stats[key] = _merge_stats(stats.get(key), value)
+    return stats
+
+
+def _rollup_stats(base_currency_id, target_currency_ids, first_month, last_month):
+    """
+    Bucket statistics of whole months, read from the precomputed rollups.
+    """
+    queryset = MonthlyRateRollup.objects.filter(base_currency_id=base_currency_id,
+                                                month__range=[first_month, last_month])
+    if target_currency_ids:
+        queryset = queryset.filter(target_currency_id__in=target_currency_ids)
+
+    return {
+        (rollup.target_currency_id, rollup.month): {
+            'count': rollup.count,
+            'min': rollup.min_rate,
+            'max': rollup.max_rate,
+            'first_date': rollup.month,
+            'first': rollup.first_rate,
+            'last_date': next_month(rollup.month) - timedelta(days=1),
+            'last': rollup.last_rate,
+            'sum': rollup.sum_rate,
+            'sum_squares': rollup.sum_squares,
+        }
+        for rollup in queryset
+    }
+
+
+def aggregate_rates(base_currency_id, target_currency_ids, date_from, date_to, bucket):
+    """
+    Computes count/first/last/min/max/mean/stddev (OHLC) of the exchange rates of
+    one base currency per target currency and bucket. Whole months of a monthly
+    aggregation come from the rollups; partial months and day/week buckets are
+    aggregated by the database.
+
+    :param base_currency_id: Id of the base currency
+    :param target_currency_ids: Ids of the target currencies, all targets when empty
+    :param date_from: First date of the range (inclusive)
+    :param date_to: Last date of the range (inclusive)
+    :param bucket: One of "day", "week" or "month"
+    :return: List of bucket dicts ordered by target currency id and period
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+
+    stats = {}
+    first_full_month = date_from if date_from.day == 1 else next_month(date_from)
+    end_of_full_months = next_month(date_to) if date_to + timedelta(days=1) == next_month(date_to) else month_start(date_to)
+
+    if bucket == 'month' and first_full_month < end_of_full_months:
+        stats.update(_rollup_stats(base_currency_id, target_currency_ids,
+                                   first_full_month, end_of_full_months - timedelta(days=1)))
+        if date_from < first_full_month:
+            stats.update(_range_stats(base_currency_id, target_currency_ids,
+                                      date_from, first_full_month - timedelta(days=1), bucket))
+        if end_of_full_months <= date_to:
+            stats.update(_range_stats(base_currency_id, target_currency_ids, end_of_full_months, date_to, bucket))
+    else:
+        stats.update(_range_stats(base_currency_id, target_currency_ids, date_from, date_to, bucket))
+
+    results = []
+    for (target_currency_id, start), value in sorted(stats.items()):
+        mean = value['sum'] / value['count']
+        results.append({
+            'target_currency_id': target_currency_id,
+            'period_start': start,
+            'count': value['count'],
+            'first': value['first'],
+            'last': value['last'],
+            'min': value['min'],
+            'max': value['max'],
+            'mean': mean,
+            'stddev': math.sqrt(max(0.0, value['sum_squares'] / value['count'] - mean * mean)),
+        })
+    return results
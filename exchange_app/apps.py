@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ExchangeAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'exchange_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401  Connects the receivers refreshing the currency registry and provider chain
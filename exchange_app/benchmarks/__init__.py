@@ -0,0 +1,10 @@
+"""
+Offline benchmark and load-test suite, driven by `python manage.py run_benchmarks`.
+
+- `datasets`: seeded, reproducible currency/exchange rate datasets
+- `stub_server`: local CurrencyBeacon-compatible HTTP server
+- `micro`: micro-benchmarks for providers, serialization, rendering and bulk inserts
+- `load`: concurrent HTTP load scenarios against the WSGI application
+- `startup`: cold import time of the WSGI/ASGI entry points (`-X importtime`)
+- `stats`: timing helpers and baseline regression checks
+"""
@@ -0,0 +1,110 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from exchange_app.aggregation import refresh_monthly_rollups
+from exchange_app.models import Currency, ExchangeRate, Provider
+from exchange_app.signals import reference_data_changed
+
+DEFAULT_CODES = ['EUR', 'USD', 'GBP', 'CHF', 'INR', 'CNY']
+
+
+def currency_codes(count):
+    """
+    Returns `count` currency codes, starting with the well known ones and
+    continuing with synthetic three letter codes (AAA, AAB, ...).
+
+    :param count: Number of codes
+    :return: List of currency codes
+    """
+    codes = DEFAULT_CODES[:count]
+    index = 0
+    while len(codes) < count:
+        code = ''.join(chr(ord('A') + (index // 26 ** power) % 26) for power in (2, 1, 0))
+        if code not in codes:
+            codes.append(code)
+        index += 1
+    return codes
+
+
+def currency_values(codes, seed):
+    """
+    Seeded value of each currency against an imaginary reference unit.
+    Rates derived from these are consistent (EUR/USD == 1 / USD/EUR).
+
+    :param codes: Currency codes
+    :param seed: Random seed
+    :return: Dict of currency code to value
+    """
+    rng = random.Random(seed)
+    return {code: rng.uniform(0.5, 1.5) for code in codes}
+
+
+def rates_for_date(codes, values, valuation_date, seed):
+    """
+    Generates the exchange rates of every currency pair for one date. Each date
+    is seeded separately so that any subset of dates can be generated
+    independently and still match a full run.
+
+    :param codes: Currency codes
+    :param values: Per-currency values from `currency_values`
+    :param valuation_date: The date to generate rates for
+    :param seed: Random seed
+    :return: Dict of (base, target) to Decimal rate
+    """
+    rng = random.Random(seed * 1_000_003 + valuation_date.toordinal())
+    # Daily drift of each currency, +/- 2%
+    day_values = {code: values[code] * rng.uniform(0.98, 1.02) for code in codes}
+    return {
+        (base, target): Decimal(day_values[target] / day_values[base]).quantize(Decimal('0.000001'))
+        for base in codes for target in codes if base != target
+    }
+
+
+def seed_dataset(currencies=6, days=30, seed=42, end_date=None, batch_size=5000):
+    """
+    Creates a reproducible dataset: providers, `currencies` currencies and the
+    rates of every pair for the `days` days up to `end_date`.
+
+    :param currencies: Number of currencies
+    :param days: Number of days of history
+    :param seed: Random seed
+    :param end_date: Last date of the dataset (defaults to today)
+    :param batch_size: Rows per bulk insert
+    :return: Dict describing the generated dataset
+    """
+    end_date = end_date or date.today()
+    codes = currency_codes(currencies)
+    values = currency_values(codes, seed)
+
+    Provider.objects.get_or_create(name='CurrencyBeacon', defaults={'is_active': True, 'priority': 1})
+    # Fallback, only used when the stub server injects faults
+    Provider.objects.get_or_create(name='Mock', defaults={'is_active': True, 'priority': 2})
+    Currency.objects.bulk_create([Currency(code=code) for code in codes], ignore_conflicts=True)
+    reference_data_changed.send(sender=Currency)  # bulk_create sends no model signals
+    currency_ids = dict(Currency.objects.filter(code__in=codes).values_list('code', 'id'))
+
+    entries = []
+    rows = 0
+    for offset in range(days):
+        valuation_date = end_date - timedelta(days=offset)
+        for (base, target), rate in rates_for_date(codes, values, valuation_date, seed).items():
+            entries.append(ExchangeRate(base_currency_id=currency_ids[base], target_currency_id=currency_ids[target],
+                                        date=valuation_date, rate=rate))
+            if len(entries) >= batch_size:
+                ExchangeRate.objects.bulk_create(entries)
+                rows += len(entries)
+                entries = []
+    if entries:
+        ExchangeRate.objects.bulk_create(entries)
+        rows += len(entries)
+    # Inserted without the ingest task, so the monthly statistics are refreshed here
+    refresh_monthly_rollups(end_date - timedelta(days=offset) for offset in range(days))
+
+    return {
+        'currencies': currencies,
+        'days': days,
+        'seed': seed,
+        'start_date': str(end_date - timedelta(days=days - 1)),
+        'end_date': str(end_date),
+        'rows': rows,
+    }
@@ -0,0 +1,96 @@
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from .stats import summarize
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    # Pooled load test clients reuse connections; avoid delayed-ACK stalls between writes
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ApplicationServer:
+    """
+    Serves the Django WSGI application on a local port from a background thread.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = ThreadedWSGIServer((host, port), QuietWSGIRequestHandler, allow_reuse_address=True)
+        self._server.set_app(get_wsgi_application())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def scenarios(codes, start_date, end_date):
+    """
+    HTTP load scenarios as (name, path, query parameters).
+    """
+    source, target = codes[0], codes[1]
+    window_start = max(start_date, end_date - timedelta(days=30))
+    return [
+        ('load.list', '/currency-rates/list', {
+            'source_currency': source, 'date_from': str(window_start), 'date_to': str(end_date)}),
+        ('load.paginate', '/exchange-rates/pagination', {
+            'source_currency': source, 'date_from': str(window_start), 'date_to': str(end_date), 'page_size': 50}),
+        ('load.convert', '/convert/', {
+            'source_currency': source, 'exchanged_currency': target, 'amount': 100}),
+    ]
+
+
+def run_scenario(base_url, path, params, requests_count, concurrency):
+    """
+    Issues `requests_count` GET requests from `concurrency` threads.
+
+    :return: Summary statistics; non-2xx responses count as errors
+    """
+    local = threading.local()
+    errors = []
+
+    def call(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        response = session.get(base_url + path, params=params, headers={'Accept-Encoding': 'gzip, br'})
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 300:
+            errors.append(response.status_code)
+        return elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(call, range(requests_count)))
+    return summarize(latencies, time.perf_counter() - started, errors=len(errors))
+
+
+def run_load_scenarios(codes, start_date, end_date, requests_count=200, concurrency=4):
+    """
+    Runs every load scenario against a freshly started application server.
+
+    :return: Dict of scenario name to summary statistics
+    """
+    results = {}
+    with ApplicationServer() as server:
+        for name, path, params in scenarios(codes, start_date, end_date):
+            results[name] = run_scenario(server.url, path, params, requests_count, concurrency)
+    return results
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from exchange_app.models import Currency, ExchangeRate
+from exchange_app.renderers import FastJSONRenderer
+from exchange_app.serializers import ExchangeRateSerializer
+from exchange_app.tasks import bulk_insert_exchange_rates
+from exchange_app.utility import CurrencyBeaconProvider, get_exchange_rate_data
+from .datasets import currency_values, rates_for_date
+from .stats import measure
+
+
+def bench_get_exchange_rate_data(codes, valuation_date, repeat):
+    """
+    Provider chain lookups (provider query + HTTP round trip to the stub server).
+    """
+    pairs = [(base, target) for base in codes for target in codes if base != target]
+    calls = iter(pairs * (repeat // len(pairs) + 1))
+
+    def call():
+        base, target = next(calls)
+        if get_exchange_rate_data(base, target, str(valuation_date)) is None:
+            raise RuntimeError(f"No rate returned for {base}/{target}")
+
+    return measure(call, repeat)
+
+
+def bench_currencybeacon_provider(codes, valuation_date, repeat):
+    """
+    CurrencyBeacon HTTP path alone (pooled session, retries), without fallback.
+    Calls that fail after retrying count as errors.
+    """
+    provider = CurrencyBeaconProvider()
+    pairs = [(base, target) for base in codes for target in codes if base != target]
+    calls = iter(pairs * (repeat // len(pairs) + 1))
+    errors = []
+
+    def call():
+        base, target = next(calls)
+        try:
+            provider.get_exchange_rate(base, target, str(valuation_date))
+        except Exception as exc:
+            errors.append(exc)
+
+    result = measure(call, repeat)
+    result['errors'] = len(errors)
+    return result
+
+
+def bench_serializer(rows, repeat):
+    """
+    `ExchangeRateSerializer(many=True)` over `rows` rows loaded from the database.
+    """
+    instances = list(ExchangeRate.objects.all()[:rows])
+    return measure(lambda: ExchangeRateSerializer(instances, many=True).data, repeat, operations_per_call=len(instances))
+
+
+def bench_render(rows, repeat):
+    """
+    `FastJSONRenderer` over the serialized form of `rows` rows.
+    """
+    data = ExchangeRateSerializer(list(ExchangeRate.objects.all()[:rows]), many=True).data
+    renderer = FastJSONRenderer()
+    return measure(lambda: renderer.render(data), repeat, operations_per_call=len(data))
+
+
+def bench_bulk_insert(codes, seed, rows, repeat, start_date):
+    """
+    `bulk_insert_exchange_rates` batches of `rows` rows, each for fresh dates
+    after `start_date` so no batch conflicts with existing data.
+    """
+    currency_ids = dict(Currency.objects.filter(code__in=codes).values_list('code', 'id'))
+    values = currency_values(codes, seed)
+    batches = []
+    day = start_date
+    for _ in range(repeat):
+        batch = []
+        while len(batch) < rows:
+            day += timedelta(days=1)
+            batch.extend(
+                ExchangeRate(base_currency_id=currency_ids[base], target_currency_id=currency_ids[target],
+                             date=day, rate=rate)
+                for (base, target), rate in rates_for_date(codes, values, day, seed).items()
+            )
+        batches.append(batch[:rows])
+
+    pending = iter(batches)
+    try:
+        return measure(lambda: bulk_insert_exchange_rates(next(pending)), repeat, operations_per_call=rows)
+    finally:
+        ExchangeRate.objects.filter(date__gt=start_date).delete()
+
+
+def run_micro_benchmarks(codes, seed, end_date, repeat=20, rows=1000):
+    """
+    Runs all micro-benchmarks.
+
+    :return: Dict of benchmark name to summary statistics
+    """
+    return {
+        'micro.get_exchange_rate_data': bench_get_exchange_rate_data(codes, end_date, repeat),
+        'micro.currencybeacon_provider': bench_currencybeacon_provider(codes, end_date, repeat),
+        f'micro.serializer_{rows}': bench_serializer(rows, repeat),
+        f'micro.render_{rows}': bench_render(rows, repeat),
+        f'micro.bulk_insert_{rows}': bench_bulk_insert(codes, seed, rows, repeat, end_date),
+    }
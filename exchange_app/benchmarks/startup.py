@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+from django.conf import settings
+from .stats import summarize
+
+ENTRY_POINTS = ('CurrencyExchange.wsgi', 'CurrencyExchange.asgi')
+
+# Loaded on first use only: web workers must not import them at startup
+LAZY_MODULES = ('celery', 'kombu', 'billiard', 'exchange_app.tasks')
+
+# Generous on purpose, the test catches heavy imports creeping back rather than small slowdowns
+IMPORT_BUDGET_MS = 1500
+
+# Imports the entry point and the URLconf (views, serializers), i.e. what a worker loads before its first response
+CHILD_SCRIPT = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "import {module}\n"
+    "from django.urls import get_resolver\n"
+    "get_resolver().url_patterns\n"
+    "print(time.perf_counter() - started)\n"
+    "print(' '.join(sorted(sys.modules)))\n"
+)
+
+
+def parse_importtime(output):
+    """
+    Parses the `-X importtime` report written to stderr.
+
+    :return: List of (module, self microseconds, cumulative microseconds)
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        entries.append((module.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def measure_import(module):
+    """
+    Imports `module` and the URLconf in a fresh interpreter started with
+    `-X importtime`, the way a web worker starts.
+
+    :return: (seconds, set of imported module names, importtime entries)
+    """
+    env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    env.pop('DJANGO_SETTINGS_MODULE', None)  # The entry point sets the production settings module
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT.format(module=module)],
+                             cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True)
+    seconds, modules = process.stdout.splitlines()[-2:]
+    return float(seconds), set(modules.split()), parse_importtime(process.stderr)
+
+
+def lazy_imports(modules):
+    """
+    :return: Sorted LAZY_MODULES found among imported module names
+    """
+    return sorted(name for name in LAZY_MODULES if name in modules)
+
+
+def run_startup_benchmarks(repeat=5):
+    """
+    Cold import time of the WSGI/ASGI entry points, each measured in `repeat`
+    fresh interpreters, with the slowest modules of the last run.
+    """
+    results = {}
+    for module in ENTRY_POINTS:
+        latencies = []
+        for _ in range(repeat):
+            seconds, modules, entries = measure_import(module)
+            latencies.append(seconds)
+        summary = summarize(latencies, sum(latencies))
+        summary['modules'] = len(modules)
+        summary['lazy_imports'] = lazy_imports(modules)
+        summary['slowest'] = [
+            {'module': name, 'self_ms': round(self_us / 1000, 3), 'cumulative_ms': round(cumulative_us / 1000, 3)}
+            for name, self_us, cumulative_us in sorted(entries, key=lambda entry: -entry[1])[:10]
+        ]
+        results[f'import:{module}'] = summary
+    return results
@@ -0,0 +1,81 @@
+import time
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of a list of samples.
+
+    :param samples: Measured values
+    :param pct: Percentile between 0 and 100
+    :return: The percentile value, or 0.0 for an empty list
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies, elapsed, operations=None, errors=0):
+    """
+    Summarizes latency samples (seconds) into milliseconds and throughput.
+
+    :param latencies: Per-operation latencies in seconds
+    :param elapsed: Wall time of the whole run in seconds
+    :param operations: Units of work done (defaults to the number of samples), e.g. rows inserted
+    :param errors: Number of failed operations
+    :return: Dict of summary statistics
+    """
+    operations = len(latencies) if operations is None else operations
+    return {
+        'samples': len(latencies),
+        'errors': errors,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'throughput_per_s': round(operations / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def measure(func, repeat, operations_per_call=1):
+    """
+    Calls `func` `repeat` times and summarizes its latency.
+
+    :param func: Zero-argument callable to benchmark
+    :param repeat: Number of calls
+    :param operations_per_call: Units of work done per call, used for throughput
+    :return: Dict of summary statistics
+    """
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started, operations=repeat * operations_per_call)
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compares benchmark results against a previous run.
+
+    A benchmark regresses when its throughput drops or its p99 latency grows by
+    more than `tolerance` (a fraction, e.g. 0.2 for 20%).
+
+    :param results: Current results, {benchmark name: summary}
+    :param baseline: Baseline results in the same shape
+    :param tolerance: Allowed relative slowdown
+    :return: List of human readable regressions
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous['throughput_per_s'] and current['throughput_per_s'] < previous['throughput_per_s'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['throughput_per_s']}/s < baseline {previous['throughput_per_s']}/s")
+        if previous['p99_ms'] and current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {current['p99_ms']}ms > baseline {previous['p99_ms']}ms")
+    return regressions
@@ -0,0 +1,205 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from .datasets import currency_values, rates_for_date
+
+
+class LatencyDistribution:
+    """
+    Response delay of the stub server, parsed from a spec:
+
+    - ``fixed:20``: always 20 ms
+    - ``uniform:10,100``: between 10 and 100 ms
+    - ``lognormal:50,0.5``: median 50 ms, sigma 0.5 (long tail)
+    - ``recorded``: resampled from the latencies of the replayed cassette
+    """
+
+    def __init__(self, kind='fixed', params=(0.0,), samples=()):
+        self.kind = kind
+        self.params = params
+        self.samples = list(samples)
+
+    @classmethod
+    def parse(cls, spec, cassette=None):
+        kind, _, values = spec.partition(':')
+        if kind == 'recorded':
+            if cassette is None or not len(cassette):
+                raise ValueError("The recorded latency distribution needs a non-empty cassette")
+            return cls(kind, samples=cassette.latencies())
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2}
+        if kind not in expected:
+            raise ValueError(f"Unknown latency distribution {kind!r}")
+        try:
+            params = tuple(float(value) for value in values.split(','))
+        except ValueError:
+            params = ()
+        if len(params) != expected[kind]:
+            raise ValueError(f"Latency distribution {kind!r} takes {expected[kind]} comma separated parameter(s)")
+        return cls(kind, params)
+
+    def sample(self, rng):
+        """
+        :param rng: random.Random instance
+        :return: Delay in seconds
+        """
+        if self.kind == 'recorded':
+            return rng.choice(self.samples) / 1000
+        if self.kind == 'uniform':
+            return rng.uniform(*self.params) / 1000
+        if self.kind == 'lognormal':
+            median, sigma = self.params
+            return rng.lognormvariate(math.log(median), sigma) / 1000
+        return self.params[0] / 1000
+
+
+class StubCurrencyBeaconServer:
+    """
+    Local HTTP server answering `/v1/historical` like the CurrencyBeacon API.
+
+    Responses are replayed from a recorded cassette when one is given, and
+    otherwise generated from the same seeded model as `datasets.seed_dataset`.
+    Optional fault injection makes fallback, pooling and retry behaviour
+    measurable offline: a latency distribution, a share of 500 responses and a
+    rate limit (requests per second) answered with 429 and `Retry-After`.
+    All randomness is seeded, so a run is reproducible.
+
+    Usage::
+
+        with StubCurrencyBeaconServer(codes, seed=42, latency=LatencyDistribution.parse('lognormal:50,0.5'),
+                                      error_rate=0.05, rate_limit=100) as stub:
+            settings.CURRENCYBEACON_API_URL = stub.url
+    """
+
+    def __init__(self, codes=(), seed=42, cassette=None, latency=None, error_rate=0.0, rate_limit=None,
+                 retry_after=1, host='127.0.0.1', port=0):
+        self.codes = list(codes)
+        self.seed = seed
+        self.values = currency_values(self.codes, seed)
+        self.cassette = cassette
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.requests = 0
+        self.responses = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = rate_limit
+        self._refilled_at = time.monotonic()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def payload(self, base, valuation_date):
+        """
+        Builds the JSON payload for a historical rates request.
+
+        :param base: Base currency code
+        :param valuation_date: Requested date as YYYY-MM-DD
+        :return: Tuple of (status code, payload dict)
+        """
+        if self.cassette is not None:
+            interaction = self.cassette.get(base, valuation_date)
+            if interaction is not None:
+                return interaction['status'], interaction['body']
+
+        if base not in self.values:
+            return 422, {'meta': {'code': 422, 'error_type': 'invalid base currency'}, 'response': []}
+        try:
+            parsed = date.fromisoformat(valuation_date)
+        except (TypeError, ValueError):
+            return 422, {'meta': {'code': 422, 'error_type': 'invalid date'}, 'response': []}
+
+        rates = {
+            target: float(rate)
+            for (pair_base, target), rate in rates_for_date(self.codes, self.values, parsed, self.seed).items()
+            if pair_base == base
+        }
+        return 200, {'meta': {'code': 200}, 'date': valuation_date, 'base': base, 'rates': rates}
+
+    def fault(self):
+        """
+        Decides the injected fault and delay of one request.
+
+        :return: Tuple of (status code and payload or None, delay in seconds)
+        """
+        with self._lock:
+            delay = self.latency.sample(self._rng) if self.latency is not None else 0.0
+
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled_at) * self.rate_limit)
+                self._refilled_at = now
+                if self._tokens < 1:
+                    return (429, {'meta': {'code': 429, 'error_type': 'rate limit exceeded'}}), 0.0
+                self._tokens -= 1
+
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return (500, {'meta': {'code': 500, 'error_type': 'internal error'}}), delay
+        return None, delay
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; with Nagle's algorithm every
+            # response on a kept-alive (pooled) connection would stall for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+                fault, delay = stub.fault()
+                if fault is not None:
+                    status, payload = fault
+                elif parsed.path.rstrip('/') != '/v1/historical':
+                    status, payload = 404, {'meta': {'code': 404, 'error_type': 'not found'}}
+                else:
+                    status, payload = stub.payload(query.get('base'), query.get('date'))
+
+                with stub._lock:
+                    stub.requests += 1
+                    stub.responses[status] += 1
+
+                time.sleep(delay)
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if status == 429:
+                    self.send_header('Retry-After', str(stub.retry_after))
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
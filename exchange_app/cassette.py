@@ -0,0 +1,86 @@
+import json
+import time
+from functools import lru_cache
+import requests
+
+
+class Cassette:
+    """
+    Recorded CurrencyBeacon `/historical` responses, keyed by base currency and
+    date, with the latency observed while recording. Stored as JSON so that
+    captures can be committed next to load test baselines.
+    """
+    VERSION = 1
+
+    def __init__(self, interactions=()):
+        self.interactions = {}
+        for interaction in interactions:
+            self.interactions[(interaction['base'], interaction['date'])] = interaction
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as handle:
+            data = json.load(handle)
+        if data.get('version') != cls.VERSION:
+            raise ValueError(f"Unsupported cassette version {data.get('version')!r} in {path}")
+        return cls(data['interactions'])
+
+    def save(self, path):
+        with open(path, 'w') as handle:
+            json.dump({'version': self.VERSION, 'interactions': list(self.interactions.values())}, handle, indent=1)
+
+    def record(self, base, valuation_date, status, body, latency_ms):
+        self.interactions[(base, str(valuation_date))] = {
+            'base': base, 'date': str(valuation_date), 'status': status, 'body': body, 'latency_ms': latency_ms}
+
+    def get(self, base, valuation_date):
+        """
+        :return: The recorded interaction dict or None
+        """
+        return self.interactions.get((base, str(valuation_date)))
+
+    def latencies(self):
+        """
+        :return: Recorded latencies in milliseconds
+        """
+        return [interaction['latency_ms'] for interaction in self.interactions.values()]
+
+    def __len__(self):
+        return len(self.interactions)
+
+
+@lru_cache(maxsize=8)
+def load_cassette(path):
+    """
+    Loads a cassette once per process.
+    """
+    return Cassette.load(path)
+
+
+def record_cassette(codes, dates, url, api_key, cassette=None, timeout=10):
+    """
+    Captures the historical rates of every base currency and date from a
+    CurrencyBeacon compatible API. The API key is not stored.
+
+    :param codes: Base currency codes
+    :param dates: Dates to capture
+    :param url: API base URL (e.g. https://api.currencybeacon.com/v1)
+    :param api_key: API key
+    :param cassette: Cassette to add to (a new one by default)
+    :param timeout: Request timeout in seconds
+    :return: The cassette
+    """
+    cassette = cassette if cassette is not None else Cassette()
+    with requests.Session() as session:
+        for base in codes:
+            for valuation_date in dates:
+                started = time.perf_counter()
+                response = session.get(f'{url}/historical', timeout=timeout,
+                                       params={'api_key': api_key, 'base': base, 'date': str(valuation_date)})
+                latency_ms = round((time.perf_counter() - started) * 1000, 3)
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = {'meta': {'code': response.status_code, 'error_type': response.text[:200]}}
+                cassette.record(base, valuation_date, response.status_code, body, latency_ms)
+    return cassette
@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from .metrics import HISTORICAL_CONVERSION_RECORDS
+from .models import ExchangeRate
+from .packing import packed_rates
+from .registry import currency_id, get_registry
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+OUTPUT_FIELDS = ['reporting_currency', 'rate', 'converted_amount', 'error']
+OUTPUT_FIELDS_SET = frozenset(OUTPUT_FIELDS)
+AMOUNT_QUANTUM = Decimal('0.000001')
+
+
+class RawRecord(dict):
+    """
+    NDJSON record that remembers its input line, so `write_records` writes the
+    caller's fields back exactly as sent (number formatting included).
+    """
+    __slots__ = ('raw',)
+
+
+def read_records(lines, fmt):
+    """
+    Parses input records lazily, one line at a time.
+
+    :param lines: Iterable of text lines
+    :param fmt: "csv" (with a header row) or "ndjson"
+    :return: Iterator of record dicts (`RawRecord` for NDJSON objects without output fields); NDJSON lines
+             that are not JSON objects are yielded as strings
+    """
+    if fmt == 'csv':
+        rows = csv.reader(lines)
+        header = next(rows, [])
+        for values in rows:
+            if values:
+                yield dict(zip(header, values + [''] * (len(header) - len(values))))
+        return
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line, parse_float=Decimal)  # Amounts stay exact
+        except ValueError:
+            yield line.rstrip('\r\n')
+            continue
+        if isinstance(record, dict) and not OUTPUT_FIELDS_SET.intersection(record):
+            raw = line.strip()
+            record = RawRecord(record)
+            record.raw = raw[:-1].rstrip() + (', ' if record else '')  # Without the closing brace
+        yield record
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(value):
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def _parse(record):
+    """
+    :return: (currency code, date, Decimal amount, error)
+    """
+    if not isinstance(record, dict):
+        return None, None, None, 'Invalid record'
+    code, day, amount = record.get('currency'), record.get('date'), record.get('amount')
+    if not code or not day or amount in (None, ''):
+        return None, None, None, 'amount, currency and date are required'
+    day = _parse_date(str(day))  # Bookings repeat few dates, each is parsed once
+    if day is None:
+        return None, None, None, 'Invalid date format. Use YYYY-MM-DD'
+    try:
+        amount = Decimal(str(amount))
+    except InvalidOperation:
+        return None, None, None, 'Invalid amount'
+    if not amount.is_finite():
+        return None, None, None, 'Invalid amount'
+    return str(code), day, amount, None
+
+
+def lookup_rates(pairs, reporting_currency_id):
+    """
+    Rates into the reporting currency for a set of (currency, date) pairs, with
+    one query on the daily rates. Rates stored only the other way round are
+    inverted; compacted months are only read for pairs missing from daily rates.
+
+    :param pairs: Set of (currency id, date)
+    :param reporting_currency_id: Id of the reporting currency
+    :return: Dict of (currency id, date) to Decimal rate, for the pairs with a rate
+    """
+    currency_ids = {currency for currency, _ in pairs}
+    direct, inverse = {}, {}
+
+    def collect(rows):
+        for base_currency_id, target_currency_id, day, rate in rows:
+            if target_currency_id == reporting_currency_id and (base_currency_id, day) in pairs:
+                direct[(base_currency_id, day)] = rate
+            elif base_currency_id == reporting_currency_id and (target_currency_id, day) in pairs and rate:
+                inverse[(target_currency_id, day)] = 1 / rate
+
+    collect(ExchangeRate.objects.filter(date__in={day for _, day in pairs}).filter(
+        Q(base_currency_id__in=currency_ids, target_currency_id=reporting_currency_id)
+        | Q(base_currency_id=reporting_currency_id, target_currency_id__in=currency_ids)
+    ).values_list('base_currency_id', 'target_currency_id', 'date', 'rate'))
+
+    missing = [day for currency, day in pairs if (currency, day) not in direct and (currency, day) not in inverse]
+    if missing:
+        collect(row[:4] for row in packed_rates(min(missing), max(missing),
+                                                base_currency_id__in=[*currency_ids, reporting_currency_id]))
+    return {**inverse, **direct}
+
+
+def convert_chunk(records, reporting_currency, reporting_currency_id, known):
+    """
+    Converts one chunk of records: they are grouped by (currency, date), the
+    rates of all groups not seen in earlier chunks are looked up at once and
+    then applied per record.
+
+    :param known: Rates of earlier chunks, (currency id, date) to Decimal rate or None; updated in place
+    :return: List of output records (input records with OUTPUT_FIELDS added)
+    """
+    parsed = [_parse(record) for record in records]
+    registry = get_registry()
+    ids = {code: registry.ids.get(code) for code, _, _, error in parsed if error is None}
+    ids.update((code, currency_id(code)) for code, value in list(ids.items()) if value is None)
+
+    pairs = {(ids[code], day) for code, day, _, error in parsed
+             if error is None and ids[code] not in (None, reporting_currency_id)} - known.keys()
+    if pairs:
+        rates = lookup_rates(pairs, reporting_currency_id)
+        known.update((pair, rates.get(pair)) for pair in pairs)
+
+    results = []
+    errors = 0
+    for record, (code, day, amount, error) in zip(records, parsed):
+        row = record if isinstance(record, dict) else {'record': record}
+        rate = None
+        if error is None:
+            if ids[code] is None:
+                error = 'Invalid currency code'
+            elif ids[code] == reporting_currency_id:
+                rate = Decimal(1)
+            else:
+                rate = known[(ids[code], day)]
+                if rate is None:
+                    error = 'No exchange rate available'
+        converted = None
+        if rate is not None:
+            try:
+                converted = str((amount * rate).quantize(AMOUNT_QUANTUM))
+            except InvalidOperation:  # Finite, but beyond the precision of the context, e.g. 1e400
+                rate, error = None, 'Invalid amount'
+        row['reporting_currency'] = reporting_currency
+        row['rate'] = str(rate.quantize(AMOUNT_QUANTUM)) if rate is not None else None
+        row['converted_amount'] = converted
+        row['error'] = error
+        errors += error is not None
+        results.append(row)
+
+    HISTORICAL_CONVERSION_RECORDS.inc(len(results) - errors, result='ok')
+    HISTORICAL_CONVERSION_RECORDS.inc(errors, result='error')
+    return results
+
+
+def convert_records(records, reporting_currency, chunk_size=None):
+    """
+    Converts (amount, currency, date) records into the reporting currency at the
+    rate of each record's date, `chunk_size` records at a time.
+
+    :param records: Iterable of record dicts, e.g. from `read_records`; the output fields are added to them in place
+    :param reporting_currency: Code of the reporting currency
+    :param chunk_size: Records per rate lookup (defaults to `HISTORICAL_CONVERSION_CHUNK_SIZE`)
+    :return: Iterator of converted chunks (lists of records)
+    :raises ValueError: When the reporting currency is unknown
+    """
+    reporting_currency_id = currency_id(reporting_currency)
+    if reporting_currency_id is None:
+        raise ValueError('Invalid reporting currency')
+    chunk_size = chunk_size or getattr(settings, 'HISTORICAL_CONVERSION_CHUNK_SIZE', 5000)
+
+    def chunks():
+        known = {}
+        iterator = iter(records)
+        while chunk := list(islice(iterator, chunk_size)):
+            yield convert_chunk(chunk, reporting_currency, reporting_currency_id, known)
+
+    return chunks()
+
+
+def _encode_json(value):
+    """
+    JSON text of a record whose input line was not kept; Decimal numbers are
+    written with all their digits.
+    """
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, dict):
+        return '{' + ', '.join(f'{json.dumps(str(key))}: {_encode_json(item)}' for key, item in value.items()) + '}'
+    if isinstance(value, list):
+        return '[' + ', '.join(_encode_json(item) for item in value) + ']'
+    return json.dumps(value)
+
+
+def _ndjson_line(row):
+    if isinstance(row, RawRecord):
+        # The input line as sent, followed by the added fields
+        return row.raw + json.dumps({field: row[field] for field in OUTPUT_FIELDS})[1:] + '\n'
+    return _encode_json(row) + '\n'
+
+
+def write_records(chunks, fmt):
+    """
+    Formats converted chunks, one string per chunk.
+
+    :param chunks: Iterable of record lists, e.g. from `convert_records`
+    :param fmt: "csv" (header written before the first chunk) or "ndjson"
+    :return: Iterator of text
+    """
+    buffer = io.StringIO()
+    writer = None
+    for chunk in chunks:
+        if fmt == 'ndjson':
+            yield ''.join(_ndjson_line(row) for row in chunk)
+            continue
+
+        if writer is None:
+            fieldnames = [field for field in chunk[0] if field not in OUTPUT_FIELDS] + OUTPUT_FIELDS
+            writer = csv.writer(buffer)
+            writer.writerow(fieldnames)
+            values = itemgetter(*fieldnames)
+        writer.writerows(values(row) for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
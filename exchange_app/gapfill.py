@@ -0,0 +1,110 @@
+import bisect
+import logging
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from .models import ExchangeRate
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('carry_forward', 'interpolate')
+RATE_QUANTUM = Decimal('0.000001')
+
+FILLED_SOURCES = [ExchangeRate.CARRY_FORWARD, ExchangeRate.INTERPOLATED]
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _fill_value(known_dates, known_rates, day, strategy, lookback):
+    """
+    Rate and source of a missing cell from the provider rates of its pair.
+
+    :param known_dates: Sorted dates with a provider rate
+    :param known_rates: Provider rates matching `known_dates`
+    :return: (rate, source), or None when there is no provider rate within the lookback
+    """
+    index = bisect.bisect_left(known_dates, day)
+    if index == 0 or (day - known_dates[index - 1]).days > lookback:
+        return None
+
+    previous_date, previous_rate = known_dates[index - 1], known_rates[index - 1]
+    if strategy == 'interpolate' and index < len(known_dates) and (known_dates[index] - previous_date).days <= lookback:
+        span = (known_dates[index] - previous_date).days
+        rate = previous_rate + (known_rates[index] - previous_rate) * (day - previous_date).days / span
+        return rate.quantize(RATE_QUANTUM), ExchangeRate.INTERPOLATED
+    return previous_rate, ExchangeRate.CARRY_FORWARD
+
+
+def fill_gaps(dates, strategy=None, lookback=None):
+    """
+    Fills missing (pair, date) cells around freshly ingested dates, so reads of
+    non-trading days are served from the database instead of the providers.
+
+    All rates within `lookback` days of the dates are read in one query and the
+    missing cells are derived from it as a set difference. A missing cell is
+    filled when its pair has a provider rate at most `lookback` days earlier,
+    either by carrying that rate forward or, when a later provider rate exists,
+    by linear interpolation. Previously filled cells are recomputed, since a
+    late provider rate may change them. Provider rates are never overwritten,
+    also not those committed by a concurrent ingest after the window was read:
+    new cells are inserted ignoring conflicts, and existing cells are only
+    updated while they are still filled.
+
+    :param dates: Ingested dates (or YYYY-MM-DD strings)
+    :param strategy: "carry_forward" or "interpolate" (defaults to `GAP_FILL_STRATEGY`)
+    :param lookback: Maximum distance in days to a provider rate (defaults to `GAP_FILL_LOOKBACK_DAYS`)
+    :return: Sorted list of dates whose rows were written
+    """
+    strategy = strategy or getattr(settings, 'GAP_FILL_STRATEGY', 'carry_forward')
+    lookback = lookback if lookback is not None else getattr(settings, 'GAP_FILL_LOOKBACK_DAYS', 7)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"strategy must be one of {', '.join(STRATEGIES)}")
+
+    dates = sorted({_as_date(value) for value in dates})
+    if not dates or lookback <= 0:
+        return []
+
+    last_ingested = max(dates)
+    window_from = dates[0] - timedelta(days=lookback)
+    window_to = min(last_ingested + timedelta(days=lookback), date.today())
+
+    known = {}
+    filled = {}
+    for row_id, base_currency_id, target_currency_id, day, rate, source in ExchangeRate.objects.filter(
+            date__range=[window_from, window_to]).order_by('date').values_list(
+            'id', 'base_currency_id', 'target_currency_id', 'date', 'rate', 'source'):
+        pair = (base_currency_id, target_currency_id)
+        if source == ExchangeRate.PROVIDER:
+            known_dates, known_rates = known.setdefault(pair, ([], []))
+            known_dates.append(day)
+            known_rates.append(rate)
+        else:
+            filled[pair + (day,)] = (row_id, (rate, source))
+
+    rows, changed = [], []
+    for pair, (known_dates, known_rates) in known.items():
+        provided = set(known_dates)
+        # Cells after the pair's last provider rate are only filled up to the ingested date, never ahead of it
+        last_day = max(known_dates[-1], last_ingested)
+        day = known_dates[0] + timedelta(days=1)
+        while day <= last_day:
+            if day not in provided:
+                value = _fill_value(known_dates, known_rates, day, strategy, lookback)
+                row_id, current = filled.get(pair + (day,), (None, None))
+                if value is not None and current != value:
+                    (changed if row_id else rows).append(ExchangeRate(
+                        id=row_id, base_currency_id=pair[0], target_currency_id=pair[1], date=day,
+                        rate=value[0], source=value[1]))
+            day += timedelta(days=1)
+
+    if rows:
+        ExchangeRate.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    if changed:
+        ExchangeRate.objects.filter(source__in=FILLED_SOURCES).bulk_update(changed, ['rate', 'source'],
+                                                                           batch_size=1000)
+    if rows or changed:
+        logger.info("Filled %d missing exchange rates (%s) around %s", len(rows) + len(changed), strategy,
+                    last_ingested)
+    return sorted({row.date for row in rows + changed})
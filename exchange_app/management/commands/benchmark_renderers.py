@@ -0,0 +1,92 @@
+import gzip
+import json
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from exchange_app.models import Currency, ExchangeRate
+from exchange_app.renderers import FastJSONRenderer
+from exchange_app.serializers import ExchangeRateSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def build_exchange_rates(rows):
+    """
+    Builds unsaved ExchangeRate instances shaped like a `CurrencyRateListView` result.
+
+    :param rows: Number of exchange rates to build
+    :return: List of ExchangeRate instances
+    """
+    base = Currency(id=1, code='EUR')
+    targets = [Currency(id=i + 2, code=code) for i, code in enumerate(['USD', 'GBP', 'CHF', 'INR', 'CNY'])]
+    start = date(2020, 1, 1)
+
+    return [
+        ExchangeRate(
+            id=n + 1,
+            base_currency=base,
+            target_currency=targets[n % len(targets)],
+            rate=Decimal('1.000000') + Decimal(n % 9973) / Decimal(100000),
+            date=start + timedelta(days=n // len(targets)),
+        )
+        for n in range(rows)
+    ]
+
+
+def best_of(repeat, func):
+    """
+    Runs `func` `repeat` times and returns the fastest wall time in milliseconds and the last result.
+    """
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = "Benchmark serialization, JSON rendering and compression of exchange rate payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='1000,100000', help="Comma separated payload sizes (default: 1000,100000)")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement, the best one is reported")
+        parser.add_argument('--json', action='store_true', help="Print machine-readable JSON instead of a table")
+
+    def handle(self, *args, **options):
+        renderers = {'drf': JSONRenderer(), 'fast': FastJSONRenderer()}
+        results = []
+
+        for rows in [int(value) for value in options['rows'].split(',')]:
+            instances = build_exchange_rates(rows)
+            serialize_ms, data = best_of(options['repeat'], lambda: ExchangeRateSerializer(instances, many=True).data)
+
+            for name, renderer in renderers.items():
+                render_ms, body = best_of(options['repeat'], lambda: renderer.render(data))
+                result = {
+                    'rows': rows,
+                    'renderer': name,
+                    'serialize_ms': round(serialize_ms, 2),
+                    'render_ms': round(render_ms, 2),
+                    'bytes': len(body),
+                    'gzip_bytes': len(gzip.compress(body, compresslevel=6)),
+                    'br_bytes': len(brotli.compress(body, quality=5)) if brotli else None,
+                }
+                results.append(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'rows':>8} {'renderer':>8} {'serialize ms':>13} {'render ms':>10} {'bytes':>10} {'gzip':>10} {'br':>10}")
+        for result in results:
+            self.stdout.write(
+                f"{result['rows']:>8} {result['renderer']:>8} {result['serialize_ms']:>13} {result['render_ms']:>10} "
+                f"{result['bytes']:>10} {result['gzip_bytes']:>10} {str(result['br_bytes']):>10}"
+            )
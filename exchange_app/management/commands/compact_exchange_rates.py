@@ -0,0 +1,17 @@
+import json
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+from exchange_app.retention import compact_exchange_rates
+
+
+class Command(BaseCommand):
+    help = "Compact daily exchange rates older than the hot window into monthly packed blocks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be compacted")
+        parser.add_argument('--cutoff', help="Compact months before this date (YYYY-MM-DD), defaults to the hot window")
+
+    def handle(self, *args, **options):
+        cutoff = parse_date(options['cutoff']) if options['cutoff'] else None
+        report = compact_exchange_rates(cutoff=cutoff, dry_run=options['dry_run'])
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,56 @@
+import io
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from exchange_app.conversion import FORMATS, convert_records, read_records, write_records
+
+
+class Command(BaseCommand):
+    help = "Convert (amount, currency, date) records from CSV or NDJSON into a reporting currency at historical rates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="Input file, or - for stdin")
+        parser.add_argument('--output', default='-', help="Output file, or - for stdout (default)")
+        parser.add_argument('--reporting-currency', default='EUR', help="Currency to convert into (default: EUR)")
+        parser.add_argument('--format', choices=FORMATS, help="Input/output format (default: from the file extension)")
+        parser.add_argument('--chunk-size', type=int, help="Records per rate lookup")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('ndjson' if options['input'].endswith(('.ndjson', '.jsonl')) else 'csv')
+        # utf-8-sig drops the byte order mark of e.g. Excel's "CSV UTF-8" exports
+        if options['input'] == '-':
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            source = open(options['input'], newline='', encoding='utf-8-sig')
+        target = None if options['output'] == '-' else open(options['output'], 'w', newline='', encoding='utf-8')
+        started = time.perf_counter()
+        records = errors = 0
+        try:
+            try:
+                chunks = convert_records(read_records(source, fmt), options['reporting_currency'],
+                                         chunk_size=options['chunk_size'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+            def counted(chunks):
+                nonlocal records, errors
+                for chunk in chunks:
+                    records += len(chunk)
+                    errors += sum(row['error'] is not None for row in chunk)
+                    yield chunk
+
+            for text in write_records(counted(chunks), fmt):
+                if target is None:
+                    self.stdout.write(text, ending='')
+                else:
+                    target.write(text)
+        finally:
+            if options['input'] == '-':
+                source.detach()  # Leaves sys.stdin open
+            else:
+                source.close()
+            if target is not None:
+                target.close()
+
+        self.stderr.write(self.style.SUCCESS(
+            f"Converted {records - errors} of {records} records in {time.perf_counter() - started:.2f}s"))
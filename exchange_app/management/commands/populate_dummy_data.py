@@ -1,38 +1,133 @@
-from django.core.management.base import BaseCommand
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 from django.utils.timezone import now
 from datetime import timedelta
 import random
+from exchange_app.aggregation import refresh_monthly_rollups
+from exchange_app.benchmarks.datasets import DEFAULT_CODES, currency_codes, currency_values, rates_for_date
 from exchange_app.models import Provider, Currency, ExchangeRate
+from exchange_app.signals import reference_data_changed
+
+UNIQUE_FIELDS = ['base_currency', 'target_currency', 'date']
+
+
+def parse_currencies(value):
+    """
+    Parses the --currencies option: either a number of currencies or a comma separated list of codes.
+    """
+    if value.isdigit():
+        return currency_codes(int(value))
+    return [code.strip().upper() for code in value.split(',') if code.strip()]
+
 
 class Command(BaseCommand):
     help = "Populate database with dummy exchange rate data for past and future dates"
 
-    def handle(self, *args, **kwargs):
-        # Updated currency list to include INR (Indian Rupee) and CNY (Chinese Yuan)
-        currencies = ['EUR', 'USD', 'GBP', 'CHF', 'INR', 'CNY']
-        days_range = 30  # Generate data for the past 30 days and next 30 days
+    def add_arguments(self, parser):
+        parser.add_argument('--currencies', default=','.join(DEFAULT_CODES),
+                            help="Number of currencies or comma separated currency codes (default: %(default)s)")
+        parser.add_argument('--days', type=int, default=30,
+                            help="Generate data for the past and next N days (default: 30)")
+        parser.add_argument('--seed', type=int, default=None,
+                            help="Random seed, makes the generated rates reproducible")
+        parser.add_argument('--bulk', action='store_true',
+                            help="Generate rates per date and upsert them in large batches instead of row by row")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows per upsert batch in bulk mode")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Parallel writer threads in bulk mode (keep at 1 on SQLite)")
+
+    def handle(self, *args, **options):
+        currencies = parse_currencies(options['currencies'])
+        days_range = options['days']  # Generate data for the past N days and next N days
+        if len(currencies) < 2:
+            raise CommandError("At least two currencies are required")
 
         # Create providers if they don't exist
         Provider.objects.get_or_create(name='CurrencyBeacon', defaults={'is_active': True, 'priority': 1})
         Provider.objects.get_or_create(name='Mock', defaults={'is_active': True, 'priority': 2})
 
         # Create currencies if they don't exist
-        for code in currencies:
-            Currency.objects.get_or_create(code=code)
+        Currency.objects.bulk_create([Currency(code=code) for code in currencies], ignore_conflicts=True)
+        reference_data_changed.send(sender=Currency)  # bulk_create sends no model signals
+        currency_ids = dict(Currency.objects.filter(code__in=currencies).values_list('code', 'id'))
 
         # Generate exchange rates for past and future dates
         today = now().date()
         date_range = [today + timedelta(days=i) for i in range(-days_range, days_range + 1)]
 
+        if options['bulk']:
+            self.populate_bulk(currencies, currency_ids, date_range, options)
+        else:
+            self.populate(currencies, currency_ids, date_range, options['seed'])
+
+        refresh_monthly_rollups(date_range)
+
+        self.stdout.write(self.style.SUCCESS('Dummy data successfully created!!'))
+
+    def populate(self, currencies, currency_ids, date_range, seed):
+        """
+        Row by row mode, one `update_or_create` per exchange rate.
+        """
+        rng = random.Random(seed)
         for exchange_date in date_range:
             for base in currencies:
                 for target in currencies:
                     if base != target:
                         ExchangeRate.objects.update_or_create(
-                            base_currency=Currency.objects.get(code=base),
-                            target_currency=Currency.objects.get(code=target),
+                            base_currency_id=currency_ids[base],
+                            target_currency_id=currency_ids[target],
                             date=exchange_date,
-                            defaults={'rate': round(random.uniform(0.5, 1.5), 4)}
+                            defaults={'rate': round(rng.uniform(0.5, 1.5), 4)}
                         )
 
-        self.stdout.write(self.style.SUCCESS('Dummy data successfully created!!'))
\ No newline at end of file
+    def populate_bulk(self, currencies, currency_ids, date_range, options):
+        """
+        Bulk mode: rates of all pairs are generated per date (seeded per date, so
+        the result does not depend on the number of workers) and written with
+        batched upserts. Dates are split across `--workers` writer threads.
+        """
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        values = currency_values(currencies, seed)
+        batch_size = options['batch_size']
+        workers = max(1, options['workers'])
+        total = len(date_range) * len(currencies) * (len(currencies) - 1)
+        progress = {'rows': 0}
+        lock = threading.Lock()
+        started = time.perf_counter()
+
+        def write(batch):
+            ExchangeRate.objects.bulk_create(batch, update_conflicts=True, unique_fields=UNIQUE_FIELDS,
+                                             update_fields=['rate'])
+            with lock:
+                progress['rows'] += len(batch)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{progress['rows']}/{total} rows ({progress['rows'] / elapsed:,.0f} rows/s)")
+
+        def populate_dates(dates):
+            try:
+                batch = []
+                for exchange_date in dates:
+                    for (base, target), rate in rates_for_date(currencies, values, exchange_date, seed).items():
+                        batch.append(ExchangeRate(base_currency_id=currency_ids[base],
+                                                  target_currency_id=currency_ids[target],
+                                                  date=exchange_date, rate=rate))
+                        if len(batch) >= batch_size:
+                            write(batch)
+                            batch = []
+                if batch:
+                    write(batch)
+            finally:
+                if workers > 1:
+                    connection.close()
+
+        self.stdout.write(f"Generating {total} rates for {len(currencies)} currencies (seed {seed})")
+        if workers == 1:
+            populate_dates(date_range)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(populate_dates, date_range[index::workers]) for index in range(workers)]:
+                future.result()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from exchange_app.aggregation import month_start, next_month, refresh_monthly_rollups
+from exchange_app.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly exchange rate rollups from the stored daily rates"
+
+    def handle(self, *args, **kwargs):
+        bounds = ExchangeRate.objects.aggregate(first=Min('date'), last=Max('date'))
+        if bounds['first'] is None:
+            self.stdout.write("No exchange rates stored, nothing to do")
+            return
+
+        month = month_start(bounds['first'])
+        written = 0
+        while month <= bounds['last']:
+            written += refresh_monthly_rollups([month])
+            self.stdout.write(f"{month:%Y-%m}: {written} rollups written")
+            month = next_month(month)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} monthly rollups"))
@@ -0,0 +1,37 @@
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from exchange_app.cassette import Cassette, record_cassette
+
+
+class Command(BaseCommand):
+    help = "Record CurrencyBeacon historical responses into a cassette for offline replay"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--currencies', required=True, help="Comma separated base currency codes")
+        parser.add_argument('--date-from', required=True, help="First date to record (YYYY-MM-DD)")
+        parser.add_argument('--date-to', required=True, help="Last date to record (YYYY-MM-DD)")
+        parser.add_argument('--output', default=settings.PROVIDER_CASSETTE,
+                            help="Cassette file, extended when it exists (default: %(default)s)")
+        parser.add_argument('--url', default=settings.CURRENCYBEACON_API_URL, help="API base URL")
+
+    def handle(self, *args, **options):
+        codes = [code.strip().upper() for code in options['currencies'].split(',') if code.strip()]
+        date_from = parse_date(options['date_from'])
+        date_to = parse_date(options['date_to'])
+        if not codes or not date_from or not date_to or date_from > date_to:
+            raise CommandError("Give currency codes and a valid date range")
+        if not settings.CURRENCYBEACON_API_KEY:
+            raise CommandError("Set CURRENCYBEACON_API_KEY to record responses")
+
+        output = options['output']
+        cassette = Cassette.load(output) if os.path.exists(output) else Cassette()
+        dates = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+        self.stdout.write(f"Recording {len(codes) * len(dates)} responses from {options['url']}")
+        record_cassette(codes, dates, options['url'], settings.CURRENCYBEACON_API_KEY, cassette=cassette)
+
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        cassette.save(output)
+        self.stdout.write(self.style.SUCCESS(f"Cassette with {len(cassette)} responses written to {output}"))
@@ -0,0 +1,103 @@
+import json
+import os
+import platform
+import tempfile
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from exchange_app.benchmarks.datasets import currency_codes, seed_dataset
+from exchange_app.benchmarks.load import run_load_scenarios
+from exchange_app.benchmarks.micro import run_micro_benchmarks
+from exchange_app.benchmarks.startup import run_startup_benchmarks
+from exchange_app.benchmarks.stats import find_regressions
+from exchange_app.benchmarks.stub_server import LatencyDistribution, StubCurrencyBeaconServer
+from exchange_app.cassette import Cassette
+
+
+class Command(BaseCommand):
+    help = "Run the offline benchmark and load-test suite against a throwaway database and a stub CurrencyBeacon server"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--currencies', type=int, default=6, help="Number of currencies in the dataset")
+        parser.add_argument('--days', type=int, default=60, help="Days of history in the dataset")
+        parser.add_argument('--seed', type=int, default=42, help="Random seed of the dataset and stub server")
+        parser.add_argument('--suites', default='micro,load,startup',
+                            help="Comma separated suites to run (micro, load, startup)")
+        parser.add_argument('--repeat', type=int, default=20, help="Iterations per micro-benchmark")
+        parser.add_argument('--rows', type=int, default=1000, help="Rows per serializer/render/bulk insert benchmark")
+        parser.add_argument('--startup-repeat', type=int, default=5,
+                            help="Fresh interpreters per entry point in the startup suite")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per load scenario")
+        parser.add_argument('--concurrency', type=int, default=4, help="Concurrent clients per load scenario")
+        parser.add_argument('--cassette', help="Replay recorded CurrencyBeacon responses from this cassette")
+        parser.add_argument('--latency', help="Stub latency: fixed:MS, uniform:MIN,MAX, lognormal:MEDIAN,SIGMA or recorded")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Share of stub responses that fail with 500")
+        parser.add_argument('--rate-limit', type=float, help="Stub requests per second before answering 429")
+        parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+        parser.add_argument('--baseline', help="JSON results of a previous run to compare against")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed throughput drop / p99 increase against the baseline (default: 0.2)")
+
+    def handle(self, *args, **options):
+        suites = set(options['suites'].split(','))
+        codes = currency_codes(options['currencies'])
+        try:
+            cassette = Cassette.load(options['cassette']) if options['cassette'] else None
+            latency = LatencyDistribution.parse(options['latency'], cassette) if options['latency'] else None
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        end_date = date(2024, 12, 31)  # Fixed so results are comparable between runs
+        start_date = end_date - timedelta(days=options['days'] - 1)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # File backed so that the load test server threads share the database
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmp_dir, 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                dataset = seed_dataset(options['currencies'], options['days'], options['seed'], end_date=end_date)
+                with StubCurrencyBeaconServer(codes, seed=options['seed'], cassette=cassette, latency=latency,
+                                              error_rate=options['error_rate'],
+                                              rate_limit=options['rate_limit']) as stub, \
+                        override_settings(CURRENCYBEACON_API_URL=stub.url,
+                                          CURRENCYBEACON_API_KEY=settings.CURRENCYBEACON_API_KEY or 'stub'):
+                    results = {}
+                    if 'micro' in suites:
+                        results.update(run_micro_benchmarks(codes, options['seed'], end_date,
+                                                            repeat=options['repeat'], rows=options['rows']))
+                    if 'load' in suites:
+                        results.update(run_load_scenarios(codes, start_date, end_date,
+                                                          requests_count=options['requests'],
+                                                          concurrency=options['concurrency']))
+                    if 'startup' in suites:
+                        results.update(run_startup_benchmarks(repeat=options['startup_repeat']))
+                    stub_responses = {str(status): count for status, count in sorted(stub.responses.items())}
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'meta': {
+                'dataset': dataset,
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'options': {key: options[key] for key in ('repeat', 'startup_repeat', 'rows', 'requests', 'concurrency',
+                                                          'cassette', 'latency', 'error_rate', 'rate_limit')},
+                'stub_responses': stub_responses,
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+            regressions = find_regressions(results, baseline['results'], options['tolerance'])
+            if regressions:
+                raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+            self.stderr.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,272 @@
+import collections
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Default latency buckets (seconds), modelled on the Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class for in-process metrics exposed in the Prometheus text format.
+    Values are kept per label combination and guarded by a lock so they can be
+    updated from request threads, Celery tasks and `asyncio.to_thread` workers.
+    """
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """
+        :return: List of (suffix, label values, extra labels, value) tuples
+        """
+        raise NotImplementedError
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        for suffix, values, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing counter.
+    """
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down, e.g. the throughput of the last ingest batch.
+    """
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    """
+    Histogram with cumulative buckets, a running sum and a count.
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the wall time (in seconds) spent inside the `with` block.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ([0], 0))
+        return sum(counts)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append(('_bucket', key, (('le', _format_value(bound)),), cumulative))
+                samples.append(('_sum', key, (), total))
+                samples.append(('_count', key, (), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered together by the `/metrics` endpoint.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def expose(self):
+        """
+        :return: All metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.expose() for metric in metrics) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Exchange rate providers (exchange_app.utility)
+PROVIDER_REQUEST_SECONDS = Histogram(
+    'exchange_provider_request_seconds', 'Latency of exchange rate provider calls', ['provider', 'result'])
+PROVIDER_ERRORS = Counter(
+    'exchange_provider_errors_total', 'Exchange rate provider calls that raised an exception', ['provider'])
+PROVIDER_RETRIES = Counter(
+    'exchange_provider_retries_total', 'Provider requests retried after a rate limit or server error',
+    ['provider', 'status'])
+
+# Ingestion (exchange_app.tasks)
+INGEST_ROWS = Counter('exchange_ingest_rows_total', 'Exchange rate rows written by bulk inserts')
+INGEST_BATCH_SECONDS = Histogram('exchange_ingest_batch_seconds', 'Duration of exchange rate bulk insert batches')
+INGEST_ROWS_PER_SECOND = Gauge(
+    'exchange_ingest_last_batch_rows_per_second', 'Insert throughput of the most recent bulk insert batch')
+
+# Views (exchange_app.middleware.MetricsMiddleware)
+VIEW_REQUEST_SECONDS = Histogram(
+    'exchange_view_request_seconds', 'Latency of API views', ['view', 'method', 'status'])
+VIEW_QUERIES = Histogram(
+    'exchange_view_queries', 'Number of SQL queries issued per API request', ['view'], buckets=QUERY_COUNT_BUCKETS)
+VIEW_QUERY_SECONDS = Histogram(
+    'exchange_view_query_seconds', 'Total SQL time spent per API request', ['view'])
+
+# Live rate stream (exchange_app.pubsub)
+RATE_STREAM_SUBSCRIBERS = Gauge('exchange_rate_stream_subscribers', 'Open live rate subscriptions in this process')
+RATE_STREAM_UPDATES = Counter('exchange_rate_stream_updates_total', 'Rate updates dispatched to live subscriptions')
+RATE_STREAM_DISCONNECTS = Counter(
+    'exchange_rate_stream_disconnects_total', 'Live rate subscriptions closed by the server', ['reason'])
+
+# Bulk historical conversion (exchange_app.conversion)
+HISTORICAL_CONVERSION_RECORDS = Counter(
+    'exchange_historical_conversion_records_total', 'Records converted in bulk at historical rates', ['result'])
+
+# Caches, hit ratio = hits / (hits + misses)
+CACHE_REQUESTS = Counter('exchange_cache_requests_total', 'Cache lookups by cache and result', ['cache', 'result'])
+
+
+def record_cache_lookup(cache, hit):
+    """
+    Records a lookup against one of the application caches.
+
+    :param cache: Name of the cache (e.g., "currency_registry")
+    :param hit: Whether the value was served from the cache
+    """
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries and SQL time of a block of work.
+    Install with `connection.execute_wrapper(counter)`.
+
+    :param collect_sql: Also count executions per SQL statement (used to spot N+1 patterns)
+    """
+
+    def __init__(self, collect_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = collections.Counter() if collect_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            if self.statements is not None:
+                self.statements[sql] += 1
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = REGISTRY.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, addr=''):
+    """
+    Serves the registry from a daemon thread, for processes without the Django
+    web stack (e.g. Celery workers).
+
+    :param port: TCP port to listen on
+    :param addr: Interface to bind, all interfaces by default
+    :return: The running server
+    """
+    server = ThreadingHTTPServer((addr, port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,164 @@
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from .metrics import QueryCounter, VIEW_QUERIES, VIEW_QUERY_SECONDS, VIEW_REQUEST_SECONDS
+from .routers import PRIMARY_COOKIE, record_write, recently_written, replica_aliases, replica_lag, replica_reads
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(request):
+    """
+    Parses the Accept-Encoding header of a request.
+
+    :param request: The incoming HTTP request
+    :return: Dict of content coding (including "*") to its quality, 0 for codings the client refuses
+    """
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if coding.strip():
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def preferred_encoding(request, supported):
+    """
+    Picks the content coding with the highest quality for a request.
+
+    :param request: The incoming HTTP request
+    :param supported: Codings the server can produce, in order of server preference (used on ties)
+    :return: The coding, or None when the client accepts none of them
+    """
+    accepted = accepted_encodings(request)
+    qualities = {coding: accepted.get(coding, accepted.get('*', 0)) for coding in supported}
+    best = max(supported, key=lambda coding: qualities[coding], default=None)
+    return best if best is not None and qualities[best] > 0 else None
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compresses responses with Brotli or gzip, whichever the client prefers (highest
+    Accept-Encoding quality) and the server supports, once they exceed
+    `RESPONSE_COMPRESSION_MIN_SIZE` bytes.
+
+    Brotli is only used for non-streaming responses and only when the optional
+    `brotli` package is installed; everything else is handled by Django's
+    `GZipMiddleware`.
+    """
+
+    def process_response(self, request, response):
+        min_size = getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)
+
+        # Small payloads are cheaper to send as-is than to compress
+        if not response.streaming and len(response.content) < min_size:
+            return response
+
+        if response.has_header('Content-Encoding'):
+            return response
+
+        # Compressing an event stream would buffer the events
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+
+        supported = ['br', 'gzip'] if brotli is not None and not response.streaming else ['gzip']
+        encoding = preferred_encoding(request, supported)
+        if encoding is None:
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+
+        if encoding == 'br':
+            patch_vary_headers(response, ('Accept-Encoding',))
+            quality = getattr(settings, 'RESPONSE_COMPRESSION_BROTLI_QUALITY', 5)
+            compressed_content = brotli.compress(response.content, quality=quality)
+            if len(compressed_content) >= len(response.content):
+                return response
+
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+            etag = response.get('ETag')
+            if etag and etag.startswith('"'):
+                response.headers['ETag'] = 'W/' + etag
+            response.headers['Content-Encoding'] = 'br'
+            return response
+
+        return super().process_response(request, response)
+
+
+class MetricsMiddleware:
+    """
+    Records per-view latency, SQL query count and SQL time.
+
+    Requests that do not resolve to a view (404s) are grouped under "unresolved".
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+
+        VIEW_REQUEST_SECONDS.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        VIEW_QUERIES.observe(counter.count, view=view)
+        VIEW_QUERY_SECONDS.observe(counter.duration, view=view)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets safe (read-only) requests read from the replicas configured in
+    `DATABASE_REPLICAS`, with read-your-writes stickiness:
+
+    - unsafe requests (POST, PUT, ...) always use the primary, and the client
+      gets a cookie keeping its reads on the primary for the replica lag window
+    - all clients read from the primary for that window after an ingest or any
+      other write recorded with `routers.record_write()`
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+
+        safe = request.method in self.SAFE_METHODS
+        with replica_reads(safe and not self.pinned_to_primary(request)):
+            response = self.get_response(request)
+
+        if not safe and response.status_code < 400:
+            record_write()
+            response.set_cookie(PRIMARY_COOKIE, str(time.time() + replica_lag()), max_age=replica_lag(),
+                                httponly=True, samesite='Lax')
+        return response
+
+    def pinned_to_primary(self, request):
+        try:
+            if float(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time():
+                return True
+        except ValueError:
+            pass
+        return recently_written()
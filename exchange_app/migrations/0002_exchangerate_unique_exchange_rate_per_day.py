@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_rates(apps, schema_editor):
+    """
+    Keeps only the most recently inserted rate of each (base, target, date) so the unique constraint can be added.
+    """
+    ExchangeRate = apps.get_model('exchange_app', 'ExchangeRate')
+    duplicates = (
+        ExchangeRate.objects.values('base_currency', 'target_currency', 'date')
+        .annotate(rows=Count('id'), keep_id=Max('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        ExchangeRate.objects.filter(
+            base_currency=duplicate['base_currency'],
+            target_currency=duplicate['target_currency'],
+            date=duplicate['date'],
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_rates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='exchangerate',
+            constraint=models.UniqueConstraint(fields=('base_currency', 'target_currency', 'date'), name='unique_exchange_rate_per_day'),
+        ),
+    ]
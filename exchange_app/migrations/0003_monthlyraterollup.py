@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-19 02:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0002_exchangerate_unique_exchange_rate_per_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRateRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('count', models.IntegerField(help_text='Number of daily rates in the month')),
+                ('min_rate', models.DecimalField(decimal_places=6, max_digits=10)),
+                ('max_rate', models.DecimalField(decimal_places=6, max_digits=10)),
+                ('first_rate', models.DecimalField(decimal_places=6, help_text='Rate of the first day with data', max_digits=10)),
+                ('last_rate', models.DecimalField(decimal_places=6, help_text='Rate of the last day with data', max_digits=10)),
+                ('sum_rate', models.FloatField(help_text='Sum of the daily rates, used to combine means across months')),
+                ('sum_squares', models.FloatField(help_text='Sum of the squared daily rates, used to combine standard deviations')),
+                ('base_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='base_rollups', to='exchange_app.currency')),
+                ('target_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='target_rollups', to='exchange_app.currency')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('base_currency', 'target_currency', 'month'), name='unique_rollup_per_month')],
+            },
+        ),
+    ]
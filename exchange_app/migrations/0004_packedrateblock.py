@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-19 02:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0003_monthlyraterollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackedRateBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('row_count', models.IntegerField(help_text='Number of daily rates in the block')),
+                ('data', models.BinaryField(help_text='zlib compressed (target currency id, day, rate) records')),
+                ('base_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='packed_rate_blocks', to='exchange_app.currency')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('base_currency', 'month'), name='unique_packed_block_per_month')],
+            },
+        ),
+    ]
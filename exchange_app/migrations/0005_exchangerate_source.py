@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0004_packedrateblock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchangerate',
+            name='source',
+            field=models.CharField(choices=[('provider', 'Provider'), ('carry_forward', 'Carried forward'), ('interpolated', 'Interpolated')], default='provider', help_text='Whether the rate came from a provider or was filled in for a missing date', max_length=16),
+        ),
+    ]
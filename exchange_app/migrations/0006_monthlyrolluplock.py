@@ -0,0 +1,20 @@
+# Generated by Django 5.1.6 on 2026-10-19 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0005_exchangerate_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollupLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month', unique=True)),
+            ],
+        ),
+    ]
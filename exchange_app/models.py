@@ -23,11 +23,81 @@ class Currency(models.Model):
 class ExchangeRate(models.Model):
     """
     Model representing an exchange rate between two currencies on a given date.
+    Dates without a provider rate (weekends, holidays) are filled by `exchange_app.gapfill`.
     """
+    PROVIDER = 'provider'
+    CARRY_FORWARD = 'carry_forward'
+    INTERPOLATED = 'interpolated'
+    SOURCE_CHOICES = [
+        (PROVIDER, 'Provider'),
+        (CARRY_FORWARD, 'Carried forward'),
+        (INTERPOLATED, 'Interpolated'),
+    ]
+
     base_currency = models.ForeignKey(Currency, related_name="base_rates", on_delete=models.CASCADE)
     target_currency = models.ForeignKey(Currency, related_name="target_rates", on_delete=models.CASCADE)
     rate = models.DecimalField(max_digits=10, decimal_places=6, help_text="Exchange rate value")
     date = models.DateField(help_text="Date of the exchange rate")
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, default=PROVIDER,
+                              help_text="Whether the rate came from a provider or was filled in for a missing date")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['base_currency', 'target_currency', 'date'], name='unique_exchange_rate_per_day'),
+        ]
 
     def __str__(self):
         return f"{self.base_currency.code} to {self.target_currency.code} on {self.date}: {self.rate}"
+
+class MonthlyRateRollup(models.Model):
+    """
+    Precomputed statistics of one currency pair over one calendar month.
+    Kept current by the ingest task so multi-year aggregations never scan daily rows.
+    """
+    base_currency = models.ForeignKey(Currency, related_name="base_rollups", on_delete=models.CASCADE)
+    target_currency = models.ForeignKey(Currency, related_name="target_rollups", on_delete=models.CASCADE)
+    month = models.DateField(help_text="First day of the month")
+    count = models.IntegerField(help_text="Number of daily rates in the month")
+    min_rate = models.DecimalField(max_digits=10, decimal_places=6)
+    max_rate = models.DecimalField(max_digits=10, decimal_places=6)
+    first_rate = models.DecimalField(max_digits=10, decimal_places=6, help_text="Rate of the first day with data")
+    last_rate = models.DecimalField(max_digits=10, decimal_places=6, help_text="Rate of the last day with data")
+    sum_rate = models.FloatField(help_text="Sum of the daily rates, used to combine means across months")
+    sum_squares = models.FloatField(help_text="Sum of the squared daily rates, used to combine standard deviations")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['base_currency', 'target_currency', 'month'], name='unique_rollup_per_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.base_currency.code} to {self.target_currency.code} in {self.month:%Y-%m}"
+
+class MonthlyRollupLock(models.Model):
+    """
+    One row per month, locked while the month's rollups are refreshed so that
+    parallel ingest tasks refresh a month one after the other.
+    """
+    month = models.DateField(unique=True, help_text="First day of the month")
+
+    def __str__(self):
+        return f"Rollup lock {self.month:%Y-%m}"
+
+class PackedRateBlock(models.Model):
+    """
+    One month of compacted daily exchange rates of a base currency, stored as a
+    compressed array of (target currency, day, rate) records.
+    See `exchange_app.retention` for the encoding.
+    """
+    base_currency = models.ForeignKey(Currency, related_name="packed_rate_blocks", on_delete=models.CASCADE)
+    month = models.DateField(help_text="First day of the month")
+    row_count = models.IntegerField(help_text="Number of daily rates in the block")
+    data = models.BinaryField(help_text="zlib compressed (target currency id, day, rate) records")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['base_currency', 'month'], name='unique_packed_block_per_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.base_currency.code} rates in {self.month:%Y-%m} ({self.row_count} rows)"
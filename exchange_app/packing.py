@@ -0,0 +1,63 @@
+import struct
+import zlib
+from decimal import Decimal
+from .models import ExchangeRate, PackedRateBlock
+
+# One record per daily rate: target currency id, day of month, rate in millionths.
+# The day (1-31) only needs the low 5 bits of its byte; the top 2 bits hold the
+# index of the rate's source in SOURCES, so blocks packed before sources were
+# stored read back as provider rates.
+RECORD = struct.Struct('<IBq')
+RATE_SCALE = Decimal('1000000')
+SOURCES = (ExchangeRate.PROVIDER, ExchangeRate.CARRY_FORWARD, ExchangeRate.INTERPOLATED)
+SOURCE_SHIFT = 6
+DAY_MASK = (1 << SOURCE_SHIFT) - 1
+
+
+def encode_rates(rows):
+    """
+    Packs daily rates of one base currency and month into a compressed blob.
+
+    :param rows: Iterable of (target currency id, date, Decimal rate, source)
+    :return: Compressed bytes
+    """
+    records = b''.join(
+        RECORD.pack(target_currency_id, day.day | SOURCES.index(source) << SOURCE_SHIFT, int(rate * RATE_SCALE))
+        for target_currency_id, day, rate, source in sorted(rows, key=lambda row: (row[0], row[1]))
+    )
+    return zlib.compress(records, 9)
+
+
+def decode_rates(month, data):
+    """
+    Unpacks a blob produced by `encode_rates`.
+
+    :param month: First day of the block's month
+    :param data: Compressed bytes
+    :return: List of (target currency id, date, Decimal rate, source)
+    """
+    return [
+        (target_currency_id, month.replace(day=day & DAY_MASK), Decimal(micros) / RATE_SCALE,
+         SOURCES[day >> SOURCE_SHIFT])
+        for target_currency_id, day, micros in RECORD.iter_unpack(zlib.decompress(bytes(data)))
+    ]
+
+
+def packed_rates(date_from, date_to, target_currency_ids=None, **block_filters):
+    """
+    Reads compacted rates back from the packed blocks overlapping a date range.
+
+    :param date_from: First date (inclusive)
+    :param date_to: Last date (inclusive)
+    :param target_currency_ids: Only return these target currencies, all when empty
+    :param block_filters: PackedRateBlock filters selecting the base currency (e.g. `base_currency_id=1`)
+    :return: List of (base currency id, target currency id, date, Decimal rate, source), ordered by date
+    """
+    blocks = PackedRateBlock.objects.filter(month__range=[date_from.replace(day=1), date_to], **block_filters)
+    rows = [
+        (block.base_currency_id, target_currency_id, day, rate, source)
+        for block in blocks
+        for target_currency_id, day, rate, source in decode_rates(block.month, block.data)
+        if date_from <= day <= date_to and (not target_currency_ids or target_currency_id in target_currency_ids)
+    ]
+    return sorted(rows, key=lambda row: (row[2], row[0], row[1]))
@@ -0,0 +1,175 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from logging.handlers import RotatingFileHandler
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from .metrics import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'HEADER': 'X-Profile',
+    'SAMPLE_RATE': 0.0,
+    'LOG_FILE': None,
+    'LOG_MAX_BYTES': 10 * 1024 * 1024,
+    'LOG_BACKUP_COUNT': 5,
+    'QUERY_BUDGET': 20,
+    'DUPLICATE_QUERY_BUDGET': 5,
+    'VIEW_BUDGETS': {},
+}
+
+_current_profile = contextvars.ContextVar('request_profile', default=None)
+
+
+def get_profiling_settings():
+    """
+    :return: `REQUEST_PROFILING` settings merged over the defaults
+    """
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_PROFILING', {})}
+
+
+class RequestProfile:
+    """
+    Timing breakdown of a single profiled request.
+    Section times are in seconds; nested sections are counted in each of them.
+    """
+
+    def __init__(self):
+        self.sections = defaultdict(float)
+        self.queries = QueryCounter(collect_sql=True)
+
+    def budget_violations(self, view, total):
+        """
+        Compares the profile against the configured query and time budgets.
+
+        :param view: Resolved view name of the request
+        :param total: Total request time in seconds
+        :return: List of human readable violations, empty when within budget
+        """
+        config = get_profiling_settings()
+        budget = {'queries': config['QUERY_BUDGET'], **config['VIEW_BUDGETS'].get(view, {})}
+        violations = []
+
+        if budget.get('queries') is not None and self.queries.count > budget['queries']:
+            violations.append(f"{self.queries.count} queries exceed the budget of {budget['queries']}")
+
+        if budget.get('total_ms') is not None and total * 1000 > budget['total_ms']:
+            violations.append(f"{total * 1000:.1f}ms exceeds the budget of {budget['total_ms']}ms")
+
+        # The same statement repeated many times is the signature of an N+1 lookup
+        if self.queries.statements:
+            sql, repeats = self.queries.statements.most_common(1)[0]
+            if repeats > config['DUPLICATE_QUERY_BUDGET']:
+                violations.append(f"possible N+1: {repeats}x {sql[:120]}")
+
+        return violations
+
+
+@contextmanager
+def section(name):
+    """
+    Adds the time spent in the `with` block to the named section of the active
+    request profile. A no-op when the current request is not being profiled.
+
+    :param name: Section name (e.g., "provider", "serialize", "render")
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.sections[name] += time.perf_counter() - started
+
+
+def server_timing(profile, total):
+    """
+    Builds a Server-Timing header value from a request profile.
+    """
+    metrics = [f'db;dur={profile.queries.duration * 1000:.2f};desc="{profile.queries.count} queries"']
+    metrics += [f'{name};dur={duration * 1000:.2f}' for name, duration in profile.sections.items()]
+    metrics.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(metrics)
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in per-request profiling.
+
+    A request is profiled when it carries the configured header or is picked by
+    `SAMPLE_RATE`. Profiled responses get a Server-Timing header and a JSON line
+    in the rotating profiling log; budget violations are logged as warnings.
+    When `REQUEST_PROFILING['ENABLED']` is false the middleware removes itself
+    from the stack at startup.
+    """
+
+    def __init__(self, get_response):
+        config = get_profiling_settings()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.header = 'HTTP_' + config['HEADER'].upper().replace('-', '_')
+        self.sample_rate = config['SAMPLE_RATE']
+        self.log = logging.getLogger('exchange_app.profiling.requests')
+
+        if config['LOG_FILE'] and not self.log.handlers:
+            os.makedirs(os.path.dirname(config['LOG_FILE']), exist_ok=True)
+            handler = RotatingFileHandler(
+                config['LOG_FILE'], maxBytes=config['LOG_MAX_BYTES'], backupCount=config['LOG_BACKUP_COUNT'])
+            self.log.addHandler(handler)
+            self.log.setLevel(logging.INFO)
+            self.log.propagate = False
+
+    def should_profile(self, request):
+        if request.META.get(self.header, '').lower() in ('1', 'true', 'yes'):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.queries))
+                response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        total = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        violations = profile.budget_violations(view, total)
+
+        response.headers['Server-Timing'] = server_timing(profile, total)
+        self.log.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(profile.queries.duration * 1000, 2),
+            'queries': profile.queries.count,
+            'sections_ms': {name: round(duration * 1000, 2) for name, duration in profile.sections.items()},
+            'budget_violations': violations,
+        }))
+        for violation in violations:
+            logger.warning("Performance budget exceeded for %s %s: %s", request.method, request.path, violation)
+
+        return response
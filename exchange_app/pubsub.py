@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils.module_loading import import_string
+from .metrics import RATE_STREAM_DISCONNECTS, RATE_STREAM_SUBSCRIBERS, RATE_STREAM_UPDATES
+from .models import ExchangeRate
+from .registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BROKER': 'exchange_app.pubsub.InProcessBroker',
+    'BROKER_URL': 'memory://',
+    'EXCHANGE': 'exchange_rates.live',
+    'HEARTBEAT_SECONDS': 15,
+    'MAX_LAG_SECONDS': 60,
+    'RETRY_MILLISECONDS': 5000,
+}
+
+
+def get_stream_settings():
+    """
+    :return: `RATE_STREAM` settings merged over the defaults
+    """
+    return {**DEFAULTS, **getattr(settings, 'RATE_STREAM', {})}
+
+
+def rate_update(base_currency, target_currency, date, rate):
+    """
+    Builds the message published for one stored exchange rate.
+    """
+    return {'base_currency': base_currency, 'target_currency': target_currency, 'date': str(date), 'rate': str(rate)}
+
+
+class Subscription:
+    """
+    Rate updates of one base currency (optionally restricted to some targets) for
+    one consumer, delivered on the consumer's event loop.
+
+    Updates are coalesced per currency pair: a consumer that falls behind only
+    receives the latest rate of each pair, and a pair whose rate did not change
+    since it was last sent is skipped. Coalescing bounds the pending updates by
+    the number of pairs, so a consumer is instead considered stuck, and closed,
+    when updates have waited for it longer than `max_lag` seconds.
+    """
+
+    def __init__(self, base_currency, target_currencies, loop, max_lag):
+        self.base_currency = base_currency
+        self.target_currencies = frozenset(target_currencies)
+        self.loop = loop
+        self.max_lag = max_lag
+        self.closed = False
+        self._pending = {}
+        self._pending_since = None  # When the oldest undelivered update arrived
+        self._sent = {}
+        self._lock = threading.Lock()
+        self._event = asyncio.Event()
+
+    def matches(self, update):
+        return (update['base_currency'] == self.base_currency
+                and (not self.target_currencies or update['target_currency'] in self.target_currencies))
+
+    def offer(self, update):
+        """
+        Queues an update, called from any thread.
+
+        :return: False once the subscription is closed
+        """
+        key = update['target_currency']
+        with self._lock:
+            if self.closed:
+                return False
+            current = self._pending.get(key) or self._sent.get(key)
+            if current is not None and (current['date'], current['rate']) == (update['date'], update['rate']):
+                return True
+            if current is not None and current['date'] > update['date']:
+                return True  # A backfill of an older date does not replace a newer rate
+            now = time.monotonic()
+            if self._pending_since is not None and now - self._pending_since > self.max_lag:
+                self.closed = True
+                RATE_STREAM_DISCONNECTS.inc(reason='slow_consumer')
+            else:
+                if not self._pending:
+                    self._pending_since = now
+                self._pending[key] = update
+        self._wake()
+        return not self.closed
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        self._wake()
+
+    def _wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # The consumer's loop is gone, nobody is waiting anymore
+            self.closed = True
+
+    async def get(self, timeout):
+        """
+        Waits up to `timeout` seconds for updates.
+
+        :return: List of pending updates, empty when the timeout expired
+        """
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        with self._lock:
+            self._event.clear()
+            updates = list(self._pending.values())
+            self._pending.clear()
+            self._pending_since = None
+            self._sent.update((update['target_currency'], update) for update in updates)
+        return updates
+
+
+class InProcessBroker:
+    """
+    Delivers published rates to subscribers of the same process. Only suitable when
+    rates are ingested in the web process (or for development and tests).
+    """
+
+    def __init__(self, **options):
+        self.options = {**get_stream_settings(), **options}
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, base_currency, target_currencies=()):
+        """
+        Registers a subscription, must be called from the consumer's event loop.
+        """
+        subscription = Subscription(base_currency, target_currencies, asyncio.get_running_loop(),
+                                    self.options['MAX_LAG_SECONDS'])
+        with self._lock:
+            self._subscriptions.add(subscription)
+            RATE_STREAM_SUBSCRIBERS.set(len(self._subscriptions))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            RATE_STREAM_SUBSCRIBERS.set(len(self._subscriptions))
+
+    def dispatch(self, updates):
+        """
+        Hands updates to the matching local subscriptions; never blocks on a consumer.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            for update in updates:
+                if subscription.matches(update) and not subscription.offer(update):
+                    self.unsubscribe(subscription)
+                    break
+        RATE_STREAM_UPDATES.inc(len(updates))
+
+    def publish(self, updates):
+        self.dispatch(updates)
+
+
+class KombuBroker(InProcessBroker):
+    """
+    Fans published rates out over a fanout exchange of the message broker (the
+    Celery broker by default), so rates ingested by Celery workers reach the
+    subscribers of every web process. Each process consumes through its own
+    exclusive queue in a background thread.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._consumer = None
+
+    def _exchange(self):
+        from kombu import Exchange
+        return Exchange(self.options['EXCHANGE'], type='fanout', durable=False)
+
+    def publish(self, updates):
+        from kombu import Connection
+        with Connection(self.options['BROKER_URL']) as connection:
+            producer = connection.Producer(serializer='json')
+            producer.publish(updates, exchange=self._exchange(), declare=[self._exchange()], retry=True)
+
+    def subscribe(self, base_currency, target_currencies=()):
+        with self._lock:
+            if self._consumer is None:
+                self._consumer = threading.Thread(target=self._consume, name='rate-stream-consumer', daemon=True)
+                self._consumer.start()
+        return super().subscribe(base_currency, target_currencies)
+
+    def _consume(self):
+        from kombu import Connection, Queue
+        while True:
+            try:
+                with Connection(self.options['BROKER_URL']) as connection:
+                    queue = Queue(f"{self.options['EXCHANGE']}.{uuid.uuid4().hex}", exchange=self._exchange(),
+                                  exclusive=True, auto_delete=True)
+                    with connection.Consumer(queue, callbacks=[self._on_message], accept=['json']):
+                        while True:
+                            try:
+                                connection.drain_events(timeout=self.options['HEARTBEAT_SECONDS'])
+                            except TimeoutError:
+                                continue
+            except Exception:
+                logger.exception("Rate stream consumer lost its broker connection, reconnecting")
+                time.sleep(self.options['RETRY_MILLISECONDS'] / 1000)
+
+    def _on_message(self, body, message):
+        self.dispatch(body)
+        message.ack()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    :return: The process wide broker configured by `RATE_STREAM['BROKER']`
+    """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(get_stream_settings()['BROKER'])()
+        return _broker
+
+
+def publish_rates(updates):
+    """
+    Publishes rate updates once the current transaction commits, so subscribers
+    never see a rate that is rolled back. Publishing failures are logged only.
+    """
+    updates = list(updates)
+    if not updates:
+        return
+
+    def publish():
+        try:
+            get_broker().publish(updates)
+        except Exception:
+            logger.exception("Publishing %d rate updates failed", len(updates))
+
+    transaction.on_commit(publish)
+
+
+def latest_rate_updates(base_currency_code, target_currency_codes=()):
+    """
+    Most recent stored rates of a base currency, sent to new subscribers before live updates.
+
+    :return: List of rate updates of the latest date
+    """
+    registry = get_registry()
+    rates = ExchangeRate.objects.filter(base_currency_id=registry.ids.get(base_currency_code))
+    if target_currency_codes:
+        rates = rates.filter(target_currency_id__in=[registry.ids.get(code) for code in target_currency_codes])
+    latest = rates.aggregate(latest=Max('date'))['latest']
+    if latest is None:
+        return []
+    return [rate_update(base_currency_code, registry.codes.get(target_currency_id), latest, rate)
+            for target_currency_id, rate in rates.filter(date=latest).values_list('target_currency_id', 'rate')]
@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from .metrics import record_cache_lookup
+from .models import ExchangeRate
+from .registry import get_registry
+from .utility import get_exchange_rate_data
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'TIMEOUT': 60 * 60 * 36,
+    'LOOKUP_TIMEOUT': 300,
+    'HOT_PAIRS': 200,
+    'DEMAND_WINDOW_DAYS': 7,
+    'DEMAND_FLUSH_SECONDS': 60,
+    'SNAPSHOT_CHECK_SECONDS': 30,
+    'WARM_WORKERS': 8,
+}
+
+KEY_PREFIX = 'exchange_app:rates'
+SNAPSHOT_KEY = f'{KEY_PREFIX}:snapshot'
+SNAPSHOT_VERSION_KEY = f'{KEY_PREFIX}:snapshot-version'
+
+
+def get_rate_cache_settings():
+    """
+    :return: `RATE_CACHE` settings merged over the defaults
+    """
+    return {**DEFAULTS, **getattr(settings, 'RATE_CACHE', {})}
+
+
+def rate_key(source_currency, exchanged_currency, day):
+    return f'{KEY_PREFIX}:{day}:{source_currency}:{exchanged_currency}'
+
+
+def demand_key(day):
+    return f'{KEY_PREFIX}:demand:{day}'
+
+
+# Conversion requests per pair are counted in process and merged into a per-day
+# counter in the shared cache at most every DEMAND_FLUSH_SECONDS. The merge is a
+# read-modify-write, so concurrent flushes may lose counts; the ranking of hot
+# pairs does not need exact numbers.
+_demand = Counter()
+_demand_lock = threading.Lock()
+_demand_flushed_at = time.monotonic()
+
+
+def record_pair_request(source_currency, exchanged_currency):
+    """
+    Counts a conversion request for the hot pair ranking.
+    """
+    global _demand_flushed_at
+    with _demand_lock:
+        _demand[f'{source_currency}:{exchanged_currency}'] += 1
+        if time.monotonic() - _demand_flushed_at < get_rate_cache_settings()['DEMAND_FLUSH_SECONDS']:
+            return
+        pending = dict(_demand)
+        _demand.clear()
+        _demand_flushed_at = time.monotonic()
+    flush_demand(pending)
+
+
+def flush_demand(pending=None):
+    """
+    Merges request counts into today's shared demand counter.
+
+    :param pending: Counts to merge, defaults to (and drains) this process's unflushed counts
+    """
+    if pending is None:
+        with _demand_lock:
+            pending = dict(_demand)
+            _demand.clear()
+    if not pending:
+        return
+
+    key = demand_key(date.today())
+    counts = Counter(cache.get(key) or {})
+    counts.update(pending)
+    cache.set(key, dict(counts), timeout=(get_rate_cache_settings()['DEMAND_WINDOW_DAYS'] + 1) * 86400)
+
+
+def hot_pairs(limit=None):
+    """
+    Most requested currency pairs over the last DEMAND_WINDOW_DAYS.
+
+    :param limit: Maximum number of pairs (defaults to HOT_PAIRS)
+    :return: List of (source currency, exchanged currency) codes, most requested first
+    """
+    options = get_rate_cache_settings()
+    today = date.today()
+    keys = [demand_key(today - timedelta(days=offset)) for offset in range(options['DEMAND_WINDOW_DAYS'])]
+    counts = Counter()
+    for daily in cache.get_many(keys).values():
+        counts.update(daily)
+    return [tuple(pair.split(':')) for pair, _ in counts.most_common(limit or options['HOT_PAIRS'])]
+
+
+def warm_rate_caches(day=None, limit=None):
+    """
+    Loads the rates of the hot pairs for `day` into the shared cache and publishes
+    them as a snapshot that every web process picks up into memory, so the first
+    conversions of the day neither miss nor stampede the providers.
+
+    Stored rates are read in one query; pairs without a stored rate are fetched
+    from the providers concurrently.
+
+    :param day: Date to warm (defaults to today)
+    :param limit: Maximum number of pairs (defaults to HOT_PAIRS)
+    :return: Number of rates cached
+    """
+    options = get_rate_cache_settings()
+    day = day or date.today()
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+
+    flush_demand()
+    pairs = hot_pairs(limit)
+    if not pairs:
+        return 0
+
+    wanted = set(pairs)
+    registry = get_registry()
+    stored = ExchangeRate.objects.filter(
+        date=day,
+        base_currency_id__in={registry.ids.get(source) for source, _ in pairs},
+        target_currency_id__in={registry.ids.get(target) for _, target in pairs},
+    ).values_list('base_currency_id', 'target_currency_id', 'rate')
+    rates = {}
+    for source_id, target_id, rate in stored:
+        pair = (registry.codes.get(source_id), registry.codes.get(target_id))
+        if pair in wanted:
+            rates[pair] = rate
+
+    def fetch(pair):
+        try:
+            return get_exchange_rate_data(pair[0], pair[1], str(day))
+        finally:
+            connection.close()
+
+    missing = [pair for pair in pairs if pair not in rates]
+    if missing:
+        with ThreadPoolExecutor(max_workers=options['WARM_WORKERS']) as executor:
+            fetched = executor.map(fetch, missing)
+            rates.update((pair, rate) for pair, rate in zip(missing, fetched) if rate is not None)
+
+    cache.set_many({rate_key(source, target, day): str(rate) for (source, target), rate in rates.items()},
+                   timeout=options['TIMEOUT'])
+    version = time.time_ns()
+    cache.set(SNAPSHOT_KEY, {
+        'version': version,
+        'date': str(day),
+        'rates': {f'{source}:{target}': str(rate) for (source, target), rate in rates.items()},
+    }, timeout=options['TIMEOUT'])
+    cache.set(SNAPSHOT_VERSION_KEY, version, timeout=options['TIMEOUT'])
+
+    logger.info("Warmed %d of %d hot pair rates for %s", len(rates), len(pairs), day)
+    return len(rates)
+
+
+class _LocalSnapshot:
+    """
+    This process's copy of the latest warmed snapshot. The shared version key is
+    checked at most every SNAPSHOT_CHECK_SECONDS, the snapshot itself is only
+    fetched when the version changed.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.date = None
+        self.rates = {}
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def get(self, source_currency, exchanged_currency, day):
+        self.refresh()
+        if self.date != str(day):
+            return None
+        return self.rates.get(f'{source_currency}:{exchanged_currency}')
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < get_rate_cache_settings()['SNAPSHOT_CHECK_SECONDS']:
+            return
+        with self.lock:
+            self.checked_at = now
+            version = cache.get(SNAPSHOT_VERSION_KEY)
+            if version is None or version == self.version:
+                return
+            snapshot = cache.get(SNAPSHOT_KEY)
+            if snapshot is not None:
+                self.version, self.date, self.rates = snapshot['version'], snapshot['date'], snapshot['rates']
+
+    def clear(self):
+        with self.lock:
+            self.version, self.date, self.rates, self.checked_at = None, None, {}, None
+
+
+local_snapshot = _LocalSnapshot()
+
+
+def cached_rate(source_currency, exchanged_currency, day):
+    """
+    Looks a rate up in this process's snapshot, then in the shared cache.
+
+    :return: Decimal rate or None on a miss
+    """
+    rate = local_snapshot.get(source_currency, exchanged_currency, day)
+    record_cache_lookup('rate_snapshot', rate is not None)
+    if rate is None:
+        rate = cache.get(rate_key(source_currency, exchanged_currency, day))
+        record_cache_lookup('rate_cache', rate is not None)
+    return Decimal(rate) if rate is not None else None
+
+
+def cache_rate(source_currency, exchanged_currency, day, rate):
+    """
+    Stores a rate looked up on a cache miss in the shared cache. It expires after
+    LOOKUP_TIMEOUT, since the day's ingest may still replace it; warmed rates are
+    rewritten after every ingest instead.
+    """
+    cache.set(rate_key(source_currency, exchanged_currency, day), str(rate),
+              timeout=get_rate_cache_settings()['LOOKUP_TIMEOUT'])
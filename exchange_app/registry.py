@@ -0,0 +1,115 @@
+import threading
+import time
+from types import MappingProxyType
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .metrics import record_cache_lookup
+from .models import Currency
+
+VERSION_KEY = 'exchange_app:currency-registry:version'
+
+
+class CurrencyRegistry:
+    """
+    Immutable snapshot of all currencies, mapping codes to ids and back.
+    """
+
+    def __init__(self, ids, version=None):
+        self.ids = MappingProxyType(dict(ids))
+        self.codes = MappingProxyType({currency_id: code for code, currency_id in self.ids.items()})
+        self.version = version
+
+    @classmethod
+    def load(cls, version=None):
+        return cls(Currency.objects.values_list('code', 'id'), version)
+
+    def __contains__(self, code):
+        return code in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+
+# The snapshot of this process. It is replaced (never mutated) when currencies
+# change here (see `exchange_app.signals`), or when another process bumped the
+# version key in the shared cache, which is checked at most every
+# CURRENCY_REGISTRY_CHECK_SECONDS.
+_registry = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    :return: The current CurrencyRegistry, loaded on first use
+    """
+    global _registry, _checked_at
+    registry = _registry
+    now = time.monotonic()
+    if registry is not None and now - _checked_at < getattr(settings, 'CURRENCY_REGISTRY_CHECK_SECONDS', 30):
+        return registry
+
+    with _lock:
+        version = cache.get(VERSION_KEY)
+        if _registry is None or _registry.version != version:
+            _registry = CurrencyRegistry.load(version)
+        _checked_at = now
+        return _registry
+
+
+def clear_registry():
+    """
+    Drops this process's snapshot only, e.g. after a rolled back transaction
+    (tests) that changed currencies without sending signals.
+    """
+    global _registry
+    _registry = None
+
+
+def invalidate_registry():
+    """
+    Drops this process's snapshot and, once the transaction commits, tells the
+    other processes to reload theirs. Code changing currencies without model
+    signals (e.g. `bulk_create`) sends `reference_data_changed` instead.
+    """
+    global _registry
+
+    def bump_version():
+        global _registry
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+        _registry = None
+
+    _registry = None
+    transaction.on_commit(bump_version)
+
+
+def currency_id(code):
+    """
+    Id of a currency code. Unknown codes are checked against the database, so a
+    currency added by another process is found before its version bump arrives.
+
+    :return: The id, or None for an unknown code
+    """
+    registry = get_registry()
+    currency_id = registry.ids.get(code)
+    record_cache_lookup('currency_registry', currency_id is not None)
+    if currency_id is None and Currency.objects.filter(code=code).exists():
+        invalidate_registry()
+        currency_id = get_registry().ids.get(code)
+    return currency_id
+
+
+def currency_code(currency_id):
+    """
+    Code of a currency id, with the same database fallback as `currency_id`.
+
+    :return: The code, or None for an unknown id
+    """
+    registry = get_registry()
+    code = registry.codes.get(currency_id)
+    record_cache_lookup('currency_registry', code is not None)
+    if code is None and Currency.objects.filter(id=currency_id).exists():
+        invalidate_registry()
+        code = get_registry().codes.get(currency_id)
+    return code
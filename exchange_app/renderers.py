@@ -0,0 +1,87 @@
+import json
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .profiling import section
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement for DRF's `JSONRenderer` backed by orjson.
+
+    Types orjson does not handle natively (Decimal, lazy strings, QuerySets)
+    and all date/time values are delegated to DRF's own `JSONEncoder`, and
+    U+2028/U+2029 are escaped like DRF does, so the payload matches the default
+    renderer. The exception are floats: orjson writes exponents without a plus
+    sign (`1e16` instead of `1e+16`, the same number) and NaN/Infinity as null
+    instead of raising. The API serializes rates as Decimal strings, not floats.
+    Falls back to the stock renderer when orjson is not installed or when the
+    client asks for an indent orjson cannot produce.
+    """
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Render `data` into JSON bytes.
+
+        :param data: The data returned by the view
+        :param accepted_media_type: The negotiated media type (may carry an `indent` parameter)
+        :param renderer_context: Context passed in by the view
+        :return: UTF-8 encoded JSON bytes
+        """
+        with section('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+
+        if orjson is None or indent not in (None, 2):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        # Valid JSON, but not valid JavaScript; they can only occur inside strings
+        return orjson.dumps(data, default=self.encoder.default, option=option).replace(
+            b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def format_event(event=None, data=None, retry=None):
+    """
+    Formats one Server-Sent Event.
+
+    :param event: Event name
+    :param data: JSON serializable payload
+    :param retry: Reconnect delay (milliseconds) advertised to the client
+    :return: The event as text, terminated by a blank line
+    """
+    lines = []
+    if retry is not None:
+        lines.append(f'retry: {retry}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    if data is not None:
+        lines.append(f'data: {json.dumps(data, cls=JSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets `text/event-stream` clients (EventSource) negotiate with a view. The view
+    streams the events itself; regular responses, i.e. errors, are sent as a
+    single `error` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event('error', data).encode(self.charset)
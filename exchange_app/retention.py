@@ -0,0 +1,120 @@
+import logging
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import TruncMonth
+from .aggregation import month_start, next_month, refresh_monthly_rollups
+from .models import ExchangeRate, PackedRateBlock
+from .packing import decode_rates, encode_rates, packed_rates
+
+logger = logging.getLogger(__name__)
+
+# Rough on-disk cost of one ExchangeRate row including its index entries, used for the dry-run report
+ESTIMATED_ROW_BYTES = 80
+
+
+def packed_exchange_rates(base_currency_id, date_from, date_to):
+    """
+    Compacted rates of a base currency as unsaved ExchangeRate instances, so they
+    can be serialized alongside rows from the database.
+
+    :return: List of ExchangeRate instances ordered by date
+    """
+    return [
+        ExchangeRate(base_currency_id=base_currency_id, target_currency_id=target_currency_id, date=day, rate=rate,
+                     source=source)
+        for base_currency_id, target_currency_id, day, rate, source in packed_rates(date_from, date_to,
+                                                                                   base_currency_id=base_currency_id)
+    ]
+
+
+class RatesWithPacked:
+    """
+    Sliceable sequence of compacted rates followed by a queryset of daily rates,
+    so paginators only fetch the page they need from the database.
+    """
+
+    def __init__(self, packed, queryset):
+        self.packed = packed
+        self.queryset = queryset
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = len(self.packed) + self.queryset.count()
+        return self._count
+
+    __len__ = count
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start, stop, _ = index.indices(self.count())
+        head = self.packed[start:stop]
+        offset = max(0, start - len(self.packed))
+        remaining = stop - start - len(head)
+        tail = list(self.queryset[offset:offset + remaining]) if remaining > 0 else []
+        return head + tail
+
+
+def compaction_cutoff():
+    """
+    :return: First day of the oldest month that keeps daily granularity
+    """
+    hot_days = getattr(settings, 'EXCHANGE_RATE_HOT_DAYS', 365)
+    return month_start(date.today() - timedelta(days=hot_days))
+
+
+def compact_exchange_rates(cutoff=None, dry_run=False):
+    """
+    Moves daily exchange rates of whole months before `cutoff` into one packed
+    block per base currency and month, and refreshes the month's rollups from it.
+
+    :param cutoff: Compact months strictly before this date's month (defaults to the hot window)
+    :param dry_run: Only report what would be compacted
+    :return: Report dict with row counts and estimated space saved
+    """
+    cutoff = month_start(cutoff or compaction_cutoff())
+    groups = (
+        ExchangeRate.objects.filter(date__lt=cutoff)
+        .annotate(month=TruncMonth('date'))
+        .values_list('base_currency_id', 'month')
+        .distinct()
+        .order_by('month', 'base_currency_id')
+    )
+
+    report = {'cutoff': str(cutoff), 'dry_run': dry_run, 'blocks': 0, 'rows': 0,
+              'estimated_bytes_before': 0, 'packed_bytes': 0}
+
+    for base_currency_id, month in groups:
+        daily = ExchangeRate.objects.filter(base_currency_id=base_currency_id,
+                                            date__gte=month, date__lt=next_month(month))
+        rows = list(daily.values_list('target_currency_id', 'date', 'rate', 'source'))
+
+        # Merge with an existing block (e.g. late backfills), daily rows win
+        existing = PackedRateBlock.objects.filter(base_currency_id=base_currency_id, month=month).first()
+        cells = {(target_currency_id, day): (rate, source) for target_currency_id, day, rate, source in
+                 (decode_rates(month, existing.data) if existing else [])}
+        cells.update({(target_currency_id, day): (rate, source) for target_currency_id, day, rate, source in rows})
+        data = encode_rates((target_currency_id, day, rate, source)
+                            for (target_currency_id, day), (rate, source) in cells.items())
+
+        report['blocks'] += 1
+        report['rows'] += len(rows)
+        report['estimated_bytes_before'] += len(rows) * ESTIMATED_ROW_BYTES
+        report['packed_bytes'] += len(data) - (len(existing.data) if existing else 0)
+
+        if dry_run:
+            continue
+
+        with transaction.atomic():
+            PackedRateBlock.objects.update_or_create(
+                base_currency_id=base_currency_id, month=month,
+                defaults={'row_count': len(cells), 'data': data})
+            daily.delete()
+            refresh_monthly_rollups([month], base_currency_ids=[base_currency_id])
+
+    report['estimated_bytes_saved'] = report['estimated_bytes_before'] - report['packed_bytes']
+    logger.info("Exchange rate compaction report: %s", report)
+    return report
@@ -0,0 +1,82 @@
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+
+PRIMARY_DATABASE = 'default'
+LAST_WRITE_CACHE_KEY = 'exchange_app:db-router:last-write'
+PRIMARY_COOKIE = 'db_primary_until'
+
+# Reads only go to replicas inside a `replica_reads()` block, i.e. during safe
+# HTTP requests. Celery tasks and management commands always use the primary.
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def replica_aliases():
+    """
+    :return: Database aliases configured as read replicas
+    """
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def replica_lag():
+    """
+    :return: Seconds during which reads stick to the primary after a write
+    """
+    return getattr(settings, 'DATABASE_REPLICA_LAG_SECONDS', 5)
+
+
+def record_write():
+    """
+    Marks that data was just written to the primary (ingest, admin change), so
+    every process reads from the primary until the replicas have caught up.
+    Requires a shared cache backend to be visible across processes.
+    """
+    if replica_aliases():
+        cache.set(LAST_WRITE_CACHE_KEY, time.time(), timeout=replica_lag())
+
+
+def recently_written():
+    """
+    :return: Whether a write was recorded within the replica lag window
+    """
+    last_write = cache.get(LAST_WRITE_CACHE_KEY)
+    return last_write is not None and time.time() - last_write < replica_lag()
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Allows reads inside the `with` block to be served by a replica.
+    """
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Routes writes to the primary and, where allowed, reads to a random replica.
+    Once something is written in a context, later reads in it stay on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if replicas and _replica_reads.get():
+            return random.choice(replicas)
+        return PRIMARY_DATABASE
+
+    def db_for_write(self, model, **hints):
+        _replica_reads.set(False)
+        return PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
@@ -1,5 +1,17 @@
 from rest_framework import serializers
 from .models import ExchangeRate, Currency, Provider
+from .profiling import section
+from .registry import currency_code, currency_id
+
+class ProfiledListSerializer(serializers.ListSerializer):
+    """
+    List serializer reporting its serialization time to the request profiler.
+    Lazily evaluated querysets are fetched here, so this includes their SQL time.
+    """
+    @property
+    def data(self):
+        with section('serialize'):
+            return super().data
 
 class ProviderSerializer(serializers.ModelSerializer):
     """
@@ -8,6 +20,7 @@ class ProviderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Provider
         fields = '__all__'
+        list_serializer_class = ProfiledListSerializer
 
 class CurrencySerializer(serializers.ModelSerializer):
     """
@@ -16,14 +29,73 @@ class CurrencySerializer(serializers.ModelSerializer):
     class Meta:
         model = Currency
         fields = '__all__'
+        list_serializer_class = ProfiledListSerializer
+
+class CurrencyBulkSerializer(serializers.ModelSerializer):
+    """
+    Item of a bulk currency create/update. Code uniqueness is checked for the
+    whole list at once by the view instead of with a query per item.
+    """
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Currency
+        fields = '__all__'
+        extra_kwargs = {'code': {'validators': []}}
+
+class ProviderBulkSerializer(serializers.ModelSerializer):
+    """
+    Item of a bulk provider create/update. Name uniqueness is checked for the
+    whole list at once by the view instead of with a query per item.
+    """
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Provider
+        fields = '__all__'
+        extra_kwargs = {'name': {'validators': []}}
+
+class CurrencyCodeField(serializers.Field):
+    """
+    Currency foreign key represented by its code. Codes are resolved through the
+    currency registry, so serializing rates does not query a currency per row.
+    """
+    default_error_messages = {'does_not_exist': 'Currency with code={value} does not exist.'}
+
+    def to_representation(self, value):
+        return currency_code(value)
+
+    def to_internal_value(self, data):
+        value = currency_id(data) if isinstance(data, str) else None
+        if value is None:
+            self.fail('does_not_exist', value=data)
+        return value
 
 class ExchangeRateSerializer(serializers.ModelSerializer):
     """
     Serializer for the ExchangeRate model.
     """
-    base_currency = serializers.SlugRelatedField(slug_field='code', queryset=Currency.objects.all())
-    target_currency = serializers.SlugRelatedField(slug_field='code', queryset=Currency.objects.all())
+    base_currency = CurrencyCodeField(source='base_currency_id')
+    target_currency = CurrencyCodeField(source='target_currency_id')
 
     class Meta:
         model = ExchangeRate
         fields = '__all__'
+        list_serializer_class = ProfiledListSerializer
+
+class RateAggregateSerializer(serializers.Serializer):
+    """
+    Serializer for one bucket of an exchange rate aggregation (OHLC plus mean and standard deviation).
+    """
+    target_currency = serializers.CharField()
+    period_start = serializers.DateField()
+    count = serializers.IntegerField()
+    first = serializers.DecimalField(max_digits=10, decimal_places=6)
+    last = serializers.DecimalField(max_digits=10, decimal_places=6)
+    min = serializers.DecimalField(max_digits=10, decimal_places=6)
+    max = serializers.DecimalField(max_digits=10, decimal_places=6)
+    mean = serializers.DecimalField(max_digits=10, decimal_places=6)
+    stddev = serializers.FloatField()
+
+    class Meta:
+        list_serializer_class = ProfiledListSerializer
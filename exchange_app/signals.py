@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from .models import Currency, Provider
+from .registry import invalidate_registry
+from .utility import invalidate_provider_chain
+
+# Sent once per change of reference data (sender: Currency or Provider), including bulk
+# writes and queryset updates that send no model signals
+reference_data_changed = Signal()
+
+
+@receiver(reference_data_changed, dispatch_uid='invalidate_reference_caches')
+def invalidate_reference_caches(sender, **kwargs):
+    """
+    Drops the in-memory currency registry or provider chain of this and, once
+    committed, every other process.
+    """
+    if sender is Currency:
+        invalidate_registry()
+    elif sender is Provider:
+        invalidate_provider_chain()
+
+
+@receiver([post_save, post_delete], sender=Currency, dispatch_uid='currency_changed')
+@receiver([post_save, post_delete], sender=Provider, dispatch_uid='provider_changed')
+def reference_row_changed(sender, **kwargs):
+    reference_data_changed.send(sender=sender)
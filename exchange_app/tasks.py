@@ -1,8 +1,18 @@
 import asyncio
-from datetime import datetime, timedelta
+import time
+from datetime import date, datetime, timedelta
 from celery import shared_task, group
 from django.db import transaction
-from .models import Currency, ExchangeRate
+from CurrencyExchange import celery_app  # noqa: F401  Tasks are sent with the project's Celery configuration
+from .aggregation import refresh_monthly_rollups
+from .gapfill import FILLED_SOURCES, fill_gaps
+from .metrics import INGEST_BATCH_SECONDS, INGEST_ROWS, INGEST_ROWS_PER_SECOND
+from .models import ExchangeRate
+from .pubsub import publish_rates, rate_update
+from .ratecache import warm_rate_caches
+from .registry import currency_code, get_registry
+from .retention import compact_exchange_rates
+from .routers import record_write
 from .utility import get_exchange_rate_data
 
 BATCH_SIZE = 100  # Number of records inserted in bulk
@@ -13,24 +23,17 @@ async def fetch_exchange_rates_async(date_str):
     Asynchronous function to fetch exchange rates for all currency pairs.
     Uses `asyncio.to_thread()` to run `get_exchange_rate_data` concurrently.
     """
-    currencies = await asyncio.to_thread(list, Currency.objects.all())  # Safe Django ORM call
-    tasks = []
+    registry = await asyncio.to_thread(get_registry)  # Safe Django ORM call on first load
+    pairs = [(base_code, target_code) for base_code in registry.ids for target_code in registry.ids
+             if base_code != target_code]
 
-    for base_currency in currencies:
-        for target_currency in currencies:
-            if base_currency == target_currency:
-                continue
+    # Schedule currency rate fetching as async tasks and run them concurrently
+    results = await asyncio.gather(*(
+        asyncio.to_thread(get_exchange_rate_data, base_code, target_code, date_str)
+        for base_code, target_code in pairs
+    ))
 
-            # Schedule currency rate fetching as an async task
-            tasks.append(asyncio.to_thread(
-                get_exchange_rate_data,
-                base_currency.code, target_currency.code, date_str
-            ))
-
-    # Run all tasks concurrently
-    results = await asyncio.gather(*tasks)
-
-    return currencies, results
+    return registry, pairs, results
 
 
 @shared_task
@@ -40,47 +43,71 @@ def fetch_and_store_exchange_rates(date_str):
     """
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    currencies, results = loop.run_until_complete(fetch_exchange_rates_async(date_str))
+    registry, pairs, results = loop.run_until_complete(fetch_exchange_rates_async(date_str))
 
     exchange_rate_entries = []
-    index = 0
-
-    for base_currency in currencies:
-        for target_currency in currencies:
-            if base_currency == target_currency:
-                continue
-
-            rate = results[index]
-            index += 1
-
-            if rate is not None:
-                exchange_rate_entries.append(
-                    ExchangeRate(
-                        base_currency=base_currency,
-                        target_currency=target_currency,
-                        date=date_str,
-                        rate=rate
-                    )
+    written_base_ids = set()
+
+    for (base_code, target_code), rate in zip(pairs, results):
+        if rate is not None:
+            exchange_rate_entries.append(
+                ExchangeRate(
+                    base_currency_id=registry.ids[base_code],
+                    target_currency_id=registry.ids[target_code],
+                    date=date_str,
+                    rate=rate
                 )
+            )
+            written_base_ids.add(registry.ids[base_code])
 
-            # Insert in batches
-            if len(exchange_rate_entries) >= BATCH_SIZE:
-                bulk_insert_exchange_rates(exchange_rate_entries)
-                exchange_rate_entries = []
+        # Insert in batches
+        if len(exchange_rate_entries) >= BATCH_SIZE:
+            bulk_insert_exchange_rates(exchange_rate_entries)
+            exchange_rate_entries = []
 
     # Final bulk insert
     if exchange_rate_entries:
         bulk_insert_exchange_rates(exchange_rate_entries)
 
+    # Fill weekends/holidays around this date, then keep the monthly statistics of the
+    # base currencies written here current
+    filled_dates = fill_gaps([date_str])
+    if filled_dates:
+        written_base_ids.update(ExchangeRate.objects.filter(date__in=filled_dates, source__in=FILLED_SOURCES)
+                                .values_list('base_currency_id', flat=True).distinct())
+    if written_base_ids:
+        refresh_monthly_rollups([date_str, *filled_dates], base_currency_ids=written_base_ids)
+
+    # The first conversions of the day are served from memory instead of the providers
+    if date_str == str(date.today()):
+        warm_rate_caches(date_str)
+
     return f"Exchange rates for {date_str} stored successfully."
 
 
 def bulk_insert_exchange_rates(entries):
     """
     Helper function to perform bulk insert inside a database transaction.
+    Publishes the rates to live subscribers after commit and records batch
+    duration and throughput metrics.
     """
+    started = time.perf_counter()
     with transaction.atomic():
-        ExchangeRate.objects.bulk_create(entries, ignore_conflicts=True)
+        # Provider rates replace rates filled in for the date before the provider had them
+        ExchangeRate.objects.bulk_create(entries, update_conflicts=True,
+                                         unique_fields=['base_currency', 'target_currency', 'date'],
+                                         update_fields=['rate', 'source'])
+        # Pushed to live subscribers once committed; codes come from the currency registry
+        publish_rates(rate_update(currency_code(entry.base_currency_id), currency_code(entry.target_currency_id),
+                                  entry.date, entry.rate)
+                      for entry in entries)
+    elapsed = time.perf_counter() - started
+    record_write()  # Keep reads on the primary until replicas have the new rates
+
+    INGEST_BATCH_SECONDS.observe(elapsed)
+    INGEST_ROWS.inc(len(entries))
+    if elapsed > 0:
+        INGEST_ROWS_PER_SECOND.set(len(entries) / elapsed)
 
 
 @shared_task
@@ -113,3 +140,27 @@ def scheduled_historical_exchange_rates():
     load_historical_exchange_rates.delay(yesterday, today)
 
     return "Daily exchange rate update scheduled."
+
+
+@shared_task
+def compact_old_exchange_rates(dry_run=False):
+    """
+    Scheduled Celery task packing daily exchange rates older than the hot window
+    (`EXCHANGE_RATE_HOT_DAYS`) into monthly blocks.
+
+    :param dry_run: Only report the rows and space that would be compacted
+    :return: The compaction report
+    """
+    return compact_exchange_rates(dry_run=dry_run)
+
+
+@shared_task
+def prewarm_rate_caches(date_str=None):
+    """
+    Scheduled Celery task loading the most requested pairs' rates into the caches
+    of every worker, in case the ingest of the day did not already do so.
+
+    :param date_str: Date to warm (defaults to today)
+    :return: Number of rates cached
+    """
+    return warm_rate_caches(date_str)
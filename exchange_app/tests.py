@@ -1,9 +1,59 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import requests
+from decimal import Decimal
+from io import StringIO
+from django.contrib import admin
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
 from unittest.mock import patch, MagicMock
 from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from rest_framework import status
-from datetime import date
+from datetime import date, timedelta
+from .admin import ExchangeRateAdmin, ProviderAdmin
+from .aggregation import aggregate_rates, refresh_monthly_rollups
+from .benchmarks.datasets import currency_codes, currency_values, rates_for_date, seed_dataset
+from .benchmarks.stats import find_regressions
+from .benchmarks.startup import ENTRY_POINTS, IMPORT_BUDGET_MS, lazy_imports, measure_import
+from .benchmarks.stub_server import LatencyDistribution, StubCurrencyBeaconServer
+from .cassette import Cassette
+from .conversion import convert_records, read_records, write_records
+from . import gapfill
+from .gapfill import fill_gaps
+from .metrics import CACHE_REQUESTS, Histogram, MetricsRegistry, PROVIDER_ERRORS
+from .middleware import CompressionMiddleware, ReplicaRoutingMiddleware
+from .models import Currency, ExchangeRate, MonthlyRateRollup, MonthlyRollupLock, PackedRateBlock, Provider
+from .profiling import ProfilingMiddleware
+from .pubsub import InProcessBroker, get_broker, rate_update
+from .ratecache import hot_pairs, local_snapshot, record_pair_request, warm_rate_caches
+from .registry import VERSION_KEY, clear_registry, currency_code, currency_id, get_registry
+from .renderers import FastJSONRenderer, format_event
+from .retention import compact_exchange_rates
+from .routers import LAST_WRITE_CACHE_KEY, PRIMARY_COOKIE, PrimaryReplicaRouter, record_write
+from .signals import reference_data_changed
+from .tasks import bulk_insert_exchange_rates, fetch_and_store_exchange_rates
+from .utility import MockProvider, ReplayProvider, clear_provider_chain, get_exchange_rate_data, provider_chain
+
+def reset_caches():
+    """
+    Clears the shared cache and this process's rate snapshot, currency registry and
+    provider chain, which the rollback after each test leaves stale since it sends no signals.
+    """
+    cache.clear()
+    local_snapshot.clear()
+    clear_registry()
+    clear_provider_chain()
 
 class CurrencyRateListViewTests(TestCase):
     """
@@ -13,22 +63,25 @@ class CurrencyRateListViewTests(TestCase):
         """Initialize API client before each test."""
         self.client = APIClient()
 
-    @patch('exchange_app.models.Currency.objects.get')
-    @patch('exchange_app.models.ExchangeRate.objects.filter')
-    def test_get_currency_rates_success(self, mock_filter, mock_get):
+    def test_get_currency_rates_success(self):
         """
         Test retrieving exchange rates successfully when valid parameters are provided.
         """
-        mock_get.return_value = MagicMock()
-        mock_filter.return_value = []
-        
+        eur = Currency.objects.create(code='EUR')
+        usd = Currency.objects.create(code='USD')
+        ExchangeRate.objects.create(base_currency=eur, target_currency=usd, date=date(2024, 1, 15), rate=Decimal('1.09'))
+
         response = self.client.get(reverse('currency-rates-list'), {
             'source_currency': 'EUR',
             'date_from': '2024-01-01',
             'date_to': '2024-02-01'
         })
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['base_currency'], 'EUR')
+        self.assertEqual(response.data[0]['target_currency'], 'USD')
+        self.assertEqual(response.data[0]['date'], '2024-01-15')
+
     def test_get_currency_rates_missing_params(self):
         """
         Test that the API returns a 400 error when required parameters are missing.
@@ -44,13 +97,12 @@ class PaginatedExchangeRateListViewTests(TestCase):
         """Initialize API client before each test."""
         self.client = APIClient()
 
-    @patch('exchange_app.models.Currency.objects.get')
     @patch('exchange_app.models.ExchangeRate.objects.filter')
-    def test_get_paginated_rates_success(self, mock_filter, mock_get):
+    def test_get_paginated_rates_success(self, mock_filter):
         """
         Test retrieving paginated exchange rates successfully when valid parameters are provided.
         """
-        mock_get.return_value = MagicMock()
+        Currency.objects.create(code='EUR')
         mock_filter.return_value = []
         
         response = self.client.get(reverse('paginated_exchange_rate_list'), {
@@ -75,15 +127,13 @@ class ConvertAmountViewTests(TestCase):
         """Initialize API client before each test."""
         self.client = APIClient()
 
-    @patch('exchange_app.models.Currency.objects.get')
-    @patch('exchange_app.models.Provider.objects.filter')
     @patch('exchange_app.views.get_exchange_rate_data')
-    def test_convert_amount_success(self, mock_get_rate, mock_providers, mock_get_currency):
+    def test_convert_amount_success(self, mock_get_rate):
         """
         Test successful currency conversion when valid parameters and providers are available.
         """
-        mock_get_currency.return_value = MagicMock()
-        mock_providers.return_value.order_by.return_value = [MagicMock(name='Provider1')]
+        Currency.objects.create(code='EUR')
+        Currency.objects.create(code='USD')
         mock_get_rate.return_value = 1.1
         
         response = self.client.get(reverse('convert-currency'), {
@@ -112,7 +162,7 @@ class LoadHistoricalRatesViewTests(TestCase):
         """Initialize API client before each test."""
         self.client = APIClient()
 
-    @patch('exchange_app.views.load_historical_exchange_rates.delay')
+    @patch('exchange_app.tasks.load_historical_exchange_rates.delay')
     def test_load_historical_rates_success(self, mock_task):
         """
         Test that the API successfully triggers a background task to load historical exchange rates.
@@ -158,3 +208,836 @@ class ProviderViewSetTests(TestCase):
         mock_all.return_value = []
         response = self.client.get(reverse('provider-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class FastJSONRendererTests(TestCase):
+    """
+    Unit tests for the orjson backed FastJSONRenderer.
+    """
+    def test_matches_default_renderer(self):
+        """
+        Test that Decimal and date values render exactly like DRF's JSONRenderer.
+        """
+        data = {'rate': Decimal('1.234500'), 'date': date(2024, 1, 1), 'rates': [{'code': 'EUR'}]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_line_separators_are_escaped(self):
+        """Test that U+2028 and U+2029 are escaped like DRF's JSONRenderer does."""
+        data = {'name': 'line\u2028paragraph\u2029end', 'code': '\u20ac'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_render_none(self):
+        """Test that an empty body is returned for None."""
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+class CompressionMiddlewareTests(TestCase):
+    """
+    Unit tests for the negotiated response CompressionMiddleware.
+    """
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get_response(self, body, accept_encoding):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        middleware = CompressionMiddleware(lambda request: HttpResponse(body))
+        return middleware(request)
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=1024)
+    def test_small_response_not_compressed(self):
+        """Test that responses below the threshold are left untouched."""
+        response = self.get_response(b'x' * 100, 'gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=1024)
+    def test_gzip_when_brotli_not_accepted(self):
+        """Test that gzip is used when the client does not accept Brotli."""
+        response = self.get_response(b'x' * 5000, 'gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), b'x' * 5000)
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=1024)
+    def test_highest_quality_encoding_is_used(self):
+        """Test that the coding with the highest Accept-Encoding quality wins, and refused codings are never used."""
+        self.assertEqual(self.get_response(b'x' * 5000, 'br;q=0.1, gzip;q=1.0')['Content-Encoding'], 'gzip')
+        self.assertEqual(self.get_response(b'x' * 5000, 'gzip;q=0.5, *')['Content-Encoding'], 'br')
+        self.assertFalse(self.get_response(b'x' * 5000, 'gzip;q=0, br;q=0').has_header('Content-Encoding'))
+
+class MetricsTests(TestCase):
+    """
+    Unit tests for the in-process metrics registry and the /metrics endpoint.
+    """
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_histogram_exposition(self):
+        """Test that histograms expose cumulative buckets, sum and count."""
+        registry = MetricsRegistry()
+        histogram = Histogram('test_seconds', 'Test histogram', ['view'], buckets=(0.1, 1), registry=registry)
+        histogram.observe(0.05, view='list')
+        histogram.observe(0.5, view='list')
+
+        exposition = registry.expose()
+        self.assertIn('test_seconds_bucket{view="list",le="0.1"} 1', exposition)
+        self.assertIn('test_seconds_bucket{view="list",le="+Inf"} 2', exposition)
+        self.assertIn('test_seconds_count{view="list"} 2', exposition)
+
+    @patch('exchange_app.utility.MockProvider.get_exchange_rate', return_value=1.2)
+    @patch('exchange_app.utility.CurrencyBeaconProvider.get_exchange_rate', side_effect=ValueError('boom'))
+    def test_provider_error_falls_back_and_is_counted(self, mock_beacon, mock_mock):
+        """Test that a failing provider is counted and the next provider is used."""
+        Provider.objects.create(name='CurrencyBeacon', priority=1)
+        Provider.objects.create(name='Mock', priority=2)
+        errors_before = PROVIDER_ERRORS.value(provider='CurrencyBeacon')
+
+        self.assertEqual(get_exchange_rate_data('EUR', 'USD', '2024-01-01'), 1.2)
+        self.assertEqual(PROVIDER_ERRORS.value(provider='CurrencyBeacon'), errors_before + 1)
+
+    def test_metrics_endpoint(self):
+        """Test that the endpoint exposes per-view latency in the Prometheus text format."""
+        self.client.get(reverse('currency-rates-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('exchange_view_request_seconds_count{view="currency-rates-list",method="GET",status="400"}',
+                      response.content.decode())
+
+class ProfilingMiddlewareTests(TestCase):
+    """
+    Unit tests for the opt-in ProfilingMiddleware.
+    """
+    def test_disabled_middleware_is_removed(self):
+        """Test that the middleware drops out of the stack when profiling is disabled."""
+        with override_settings(REQUEST_PROFILING={'ENABLED': False}):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_profiled_request_reports_timings_and_n_plus_one(self):
+        """
+        Test that a request with the profiling header gets a Server-Timing header,
+        that serializing rates no longer looks currencies up per row, and that
+        repeated lookups are flagged as a budget violation.
+        """
+        eur = Currency.objects.create(code='EUR')
+        for code in ['USD', 'GBP', 'CHF']:
+            ExchangeRate.objects.create(base_currency=eur, target_currency=Currency.objects.create(code=code),
+                                        rate=Decimal('1.1'), date=date(2024, 1, 1))
+
+        with override_settings(REQUEST_PROFILING={'ENABLED': True, 'LOG_FILE': None, 'DUPLICATE_QUERY_BUDGET': 2}):
+            with self.assertNoLogs('exchange_app.profiling', level='WARNING'):
+                response = APIClient().get(reverse('currency-rates-list'), {
+                    'source_currency': 'EUR',
+                    'date_from': '2024-01-01',
+                    'date_to': '2024-01-31'
+                }, HTTP_X_PROFILE='1')
+
+            def per_row_lookups(request):
+                for code in ['USD', 'GBP', 'CHF']:
+                    Currency.objects.get(code=code)
+                return HttpResponse()
+
+            with self.assertLogs('exchange_app.profiling', level='WARNING') as logs:
+                ProfilingMiddleware(per_row_lookups)(RequestFactory().get('/', HTTP_X_PROFILE='1'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+        self.assertIn('possible N+1', logs.output[0])
+
+class BenchmarkSuiteTests(TestCase):
+    """
+    Unit tests for the offline benchmark helpers.
+    """
+    def test_seed_dataset_is_reproducible(self):
+        """Test that the same seed always produces the same rates."""
+        summary = seed_dataset(currencies=3, days=2, seed=7, end_date=date(2024, 1, 2))
+        self.assertEqual(summary['rows'], 3 * 2 * 2)
+
+        codes = currency_codes(3)
+        expected = rates_for_date(codes, currency_values(codes, 7), date(2024, 1, 2), 7)
+        stored = ExchangeRate.objects.get(base_currency__code='EUR', target_currency__code='USD', date=date(2024, 1, 2))
+        self.assertEqual(stored.rate, expected[('EUR', 'USD')])
+        rollups = MonthlyRateRollup.objects.filter(month=date(2024, 1, 1))
+        self.assertEqual(sorted(rollups.values_list('count', flat=True)), [2] * 6)
+
+    def test_find_regressions(self):
+        """Test that throughput drops and p99 increases beyond the tolerance are reported."""
+        baseline = {'load.list': {'throughput_per_s': 100.0, 'p99_ms': 10.0}}
+        self.assertEqual(find_regressions({'load.list': {'throughput_per_s': 95.0, 'p99_ms': 11.0}}, baseline, 0.2), [])
+        self.assertEqual(len(find_regressions({'load.list': {'throughput_per_s': 50.0, 'p99_ms': 20.0}}, baseline, 0.2)), 2)
+
+class StartupImportTests(TestCase):
+    """
+    Budget tests for the cold start of web workers.
+    """
+    def test_entry_points_import_within_budget_without_celery(self):
+        """Test that the WSGI/ASGI entry points load their views without Celery or the tasks, within budget."""
+        for module in ENTRY_POINTS:
+            with self.subTest(module=module):
+                seconds, modules, entries = measure_import(module)
+                self.assertEqual(lazy_imports(modules), [])
+                self.assertIn('exchange_app.views', modules)
+                self.assertIn(module, [name for name, _, _ in entries])
+                self.assertLess(seconds * 1000, IMPORT_BUDGET_MS)
+
+class PopulateDummyDataCommandTests(TestCase):
+    """
+    Unit tests for the populate_dummy_data management command.
+    """
+    def test_bulk_mode_is_seeded_and_idempotent(self):
+        """Test that bulk mode upserts the same seeded rates when run twice."""
+        call_command('populate_dummy_data', bulk=True, currencies='3', days=1, seed=5, stdout=StringIO())
+        first = list(ExchangeRate.objects.order_by('id').values_list('base_currency', 'target_currency', 'date', 'rate'))
+        call_command('populate_dummy_data', bulk=True, currencies='3', days=1, seed=5, stdout=StringIO())
+        second = list(ExchangeRate.objects.order_by('id').values_list('base_currency', 'target_currency', 'date', 'rate'))
+
+        self.assertEqual(len(first), 3 * 2 * 3)
+        self.assertEqual(first, second)
+
+@override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_REPLICA_LAG_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+    """
+    Unit tests for the primary/replica database router and its middleware.
+    """
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+        cache.delete(LAST_WRITE_CACHE_KEY)
+
+    def read_database(self, request):
+        """Runs a request through the middleware and returns the database a read would use."""
+        used = {}
+
+        def view(request):
+            used['db'] = self.router.db_for_read(Currency)
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return used['db'], response
+
+    def test_reads_outside_requests_use_primary(self):
+        """Test that tasks and commands read from the primary."""
+        self.assertEqual(self.router.db_for_read(Currency), 'default')
+
+    def test_safe_request_reads_from_replica(self):
+        """Test that GET requests are routed to a replica."""
+        db, _ = self.read_database(self.factory.get('/currencies/'))
+        self.assertEqual(db, 'replica1')
+
+    def test_write_request_pins_client_to_primary(self):
+        """Test that a write request sets a cookie keeping the client's next reads on the primary."""
+        db, response = self.read_database(self.factory.post('/currencies/'))
+        self.assertEqual(db, 'default')
+
+        cache.delete(LAST_WRITE_CACHE_KEY)
+        request = self.factory.get('/currencies/')
+        request.COOKIES[PRIMARY_COOKIE] = response.cookies[PRIMARY_COOKIE].value
+        db, _ = self.read_database(request)
+        self.assertEqual(db, 'default')
+
+    def test_reads_stick_to_primary_after_ingest(self):
+        """Test that all clients read from the primary right after an ingest."""
+        record_write()
+        db, _ = self.read_database(self.factory.get('/currencies/'))
+        self.assertEqual(db, 'default')
+
+class RateAggregationViewTests(TestCase):
+    """
+    Unit tests for the RateAggregationView API endpoint and the monthly rollups.
+    """
+    def setUp(self):
+        self.client = APIClient()
+        eur = Currency.objects.create(code='EUR')
+        usd = Currency.objects.create(code='USD')
+        # January fully covered, February only on the 1st and 2nd
+        days = [date(2024, 1, day) for day in range(1, 32)] + [date(2024, 2, 1), date(2024, 2, 2)]
+        for index, day in enumerate(days):
+            ExchangeRate.objects.create(base_currency=eur, target_currency=usd, date=day,
+                                        rate=Decimal('1.000000') + Decimal(index) / 100)
+        refresh_monthly_rollups(days)
+
+    def aggregate(self, **params):
+        return self.client.get(reverse('currency-rates-aggregate'), {'source_currency': 'EUR', **params})
+
+    def test_monthly_aggregation_combines_rollups_and_raw_rows(self):
+        """Test that full months come from rollups and partial months from daily rows with the same statistics."""
+        response = self.aggregate(date_from='2024-01-01', date_to='2024-02-01', bucket='month')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        january, february = response.data['results']
+        self.assertEqual(january['count'], 31)
+        self.assertEqual(january['first'], '1.000000')
+        self.assertEqual(january['last'], '1.300000')
+        self.assertEqual(january['min'], '1.000000')
+        self.assertEqual(january['max'], '1.300000')
+        self.assertEqual(january['mean'], '1.150000')
+        self.assertAlmostEqual(january['stddev'], statistics.pstdev([1 + i / 100 for i in range(31)]), places=6)
+        self.assertEqual(february['count'], 1)
+
+        daily = self.aggregate(date_from='2024-01-01', date_to='2024-01-31', bucket='day', target_currencies='USD')
+        self.assertEqual(len(daily.data['results']), 31)
+
+    def test_admin_edits_refresh_rollups(self):
+        """Test that changing or deleting rates in the admin refreshes the rollups of the affected months."""
+        model_admin = ExchangeRateAdmin(ExchangeRate, admin.site)
+        rate = ExchangeRate.objects.get(date=date(2024, 2, 2))
+        rate.date = date(2024, 3, 1)
+        model_admin.save_model(None, rate, MagicMock(initial={'date': date(2024, 2, 2)}), True)
+        self.assertEqual(MonthlyRateRollup.objects.get(month=date(2024, 2, 1)).count, 1)
+        self.assertEqual(MonthlyRateRollup.objects.get(month=date(2024, 3, 1)).last_rate, rate.rate)
+
+        model_admin.delete_queryset(None, ExchangeRate.objects.filter(date__gte=date(2024, 2, 1)))
+        self.assertEqual(list(MonthlyRateRollup.objects.values_list('month', flat=True)), [date(2024, 1, 1)])
+
+    def test_ingest_refreshes_locked_month_of_written_base_currencies(self):
+        """Test that the ingest task refreshes its month under the month lock and only for the base currencies it wrote."""
+        gbp = Currency.objects.create(code='GBP')
+        eur, usd = Currency.objects.get(code='EUR'), Currency.objects.get(code='USD')
+        MonthlyRateRollup.objects.create(base_currency=gbp, target_currency=usd, month=date(2024, 1, 1), count=99,
+                                         min_rate=1, max_rate=1, first_rate=1, last_rate=1, sum_rate=99,
+                                         sum_squares=99)
+
+        registry = get_registry()
+
+        async def fetched(date_str):
+            return registry, [('EUR', 'GBP'), ('GBP', 'USD')], [Decimal('0.86'), None]
+
+        with patch('exchange_app.tasks.fetch_exchange_rates_async', fetched):
+            fetch_and_store_exchange_rates('2024-01-15')
+
+        self.assertTrue(MonthlyRollupLock.objects.filter(month=date(2024, 1, 1)).exists())
+        self.assertEqual(MonthlyRateRollup.objects.get(base_currency=eur, target_currency=gbp).count, 1)
+        self.assertEqual(MonthlyRateRollup.objects.get(base_currency=gbp).count, 99)  # Not written, not refreshed
+
+    def test_invalid_bucket(self):
+        """Test that the API returns a 400 error for an unknown bucket."""
+        response = self.aggregate(date_from='2024-01-01', date_to='2024-02-01', bucket='year')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class RetentionTests(TestCase):
+    """
+    Unit tests for compaction of old exchange rates into packed monthly blocks.
+    """
+    def setUp(self):
+        self.client = APIClient()
+        eur = Currency.objects.create(code='EUR')
+        usd = Currency.objects.create(code='USD')
+        gbp = Currency.objects.create(code='GBP')
+        self.days = [date(2020, 1, day) for day in range(1, 11)] + [date(2024, 1, 1)]
+        for index, day in enumerate(self.days):
+            for target in (usd, gbp):
+                ExchangeRate.objects.create(base_currency=eur, target_currency=target, date=day,
+                                            rate=Decimal('1.123456') + Decimal(index) / 1000)
+
+    def test_dry_run_changes_nothing(self):
+        """Test that a dry run only reports the rows it would compact."""
+        report = compact_exchange_rates(cutoff=date(2021, 1, 1), dry_run=True)
+        self.assertEqual(report['rows'], 20)
+        self.assertEqual(ExchangeRate.objects.count(), 22)
+        self.assertFalse(PackedRateBlock.objects.exists())
+
+    def test_compacted_rates_are_read_back_transparently(self):
+        """Test that list, pagination and aggregation endpoints return compacted rates unchanged."""
+        before = self.client.get(reverse('currency-rates-list'), {
+            'source_currency': 'EUR', 'date_from': '2020-01-01', 'date_to': '2024-12-31'}).data
+
+        report = compact_exchange_rates(cutoff=date(2021, 1, 1))
+        self.assertEqual((report['blocks'], report['rows']), (1, 20))
+        self.assertEqual(ExchangeRate.objects.count(), 2)
+        self.assertGreater(report['estimated_bytes_saved'], 0)
+
+        after = self.client.get(reverse('currency-rates-list'), {
+            'source_currency': 'EUR', 'date_from': '2020-01-01', 'date_to': '2024-12-31'}).data
+        self.assertEqual(sorted(((row['date'], row['target_currency'], row['rate']) for row in after)),
+                         sorted(((row['date'], row['target_currency'], row['rate']) for row in before)))
+
+        page = self.client.get(reverse('paginated_exchange_rate_list'), {
+            'source_currency': 'EUR', 'date_from': '2020-01-01', 'date_to': '2024-12-31', 'page_size': 15, 'page': 2})
+        self.assertEqual(page.data['count'], 22)
+        self.assertEqual([row['date'] for row in page.data['results']][-2:], ['2024-01-01', '2024-01-01'])
+
+        weekly = aggregate_rates(Currency.objects.get(code='EUR').id, [], date(2020, 1, 1), date(2020, 1, 31), 'week')
+        self.assertEqual(sum(row['count'] for row in weekly), 20)
+        self.assertTrue(MonthlyRateRollup.objects.filter(month=date(2020, 1, 1), count=10).exists())
+
+    def test_compacted_rates_keep_their_source(self):
+        """Test that filled rates are still reported as filled after compaction."""
+        ExchangeRate.objects.filter(date=date(2020, 1, 4)).update(source=ExchangeRate.CARRY_FORWARD)
+        ExchangeRate.objects.filter(date=date(2020, 1, 5)).update(source=ExchangeRate.INTERPOLATED)
+        params = {'source_currency': 'EUR', 'date_from': '2020-01-01', 'date_to': '2020-01-31'}
+        before = self.client.get(reverse('currency-rates-list'), params).data
+
+        compact_exchange_rates(cutoff=date(2021, 1, 1))
+        after = self.client.get(reverse('currency-rates-list'), params).data
+        self.assertEqual(sorted((row['date'], row['target_currency'], row['source']) for row in after),
+                         sorted((row['date'], row['target_currency'], row['source']) for row in before))
+        self.assertEqual({row['source'] for row in after},
+                         {ExchangeRate.PROVIDER, ExchangeRate.CARRY_FORWARD, ExchangeRate.INTERPOLATED})
+
+class RateStreamTests(TestCase):
+    """
+    Unit tests for the live rate stream (Server-Sent Events) and its pub/sub.
+    """
+    def setUp(self):
+        reset_caches()
+        self.eur = Currency.objects.create(code='EUR')
+        self.usd = Currency.objects.create(code='USD')
+        ExchangeRate.objects.create(base_currency=self.eur, target_currency=self.usd, date=date(2024, 1, 2), rate=1.1)
+
+    async def test_subscription_coalesces_updates_and_drops_slow_consumers(self):
+        """Test that a subscriber only gets the latest changed rate per pair and is closed when too far behind."""
+        broker = InProcessBroker(MAX_LAG_SECONDS=30)
+        subscription = broker.subscribe('EUR', ['USD', 'GBP'])
+        broker.publish([rate_update('EUR', 'USD', '2024-01-02', '1.1'), rate_update('EUR', 'USD', '2024-01-03', '1.2'),
+                        rate_update('EUR', 'JPY', '2024-01-03', '150')])
+        self.assertEqual(await subscription.get(1), [rate_update('EUR', 'USD', '2024-01-03', '1.2')])
+
+        broker.publish([rate_update('EUR', 'USD', '2024-01-03', '1.2')])
+        self.assertEqual(await subscription.get(0.01), [])
+
+        with patch('exchange_app.pubsub.time.monotonic', side_effect=[100, 100, 129, 131]):
+            for rate in ['1.3', '1.4', '1.5']:  # Repeated changes of one pair stay coalesced, but not forever
+                broker.publish([rate_update('EUR', 'USD', '2024-01-04', rate)])
+            self.assertFalse(subscription.closed)
+            broker.publish([rate_update('EUR', 'GBP', '2024-01-04', '0.8')])
+        self.assertTrue(subscription.closed)
+
+    async def test_stream_pushes_latest_and_published_rates(self):
+        """Test that the stream starts with the latest stored rates and then pushes published ones."""
+        with patch('exchange_app.pubsub._broker', InProcessBroker()):
+            response = await self.async_client.get(reverse('currency-rates-stream'), {
+                'source_currency': 'EUR', 'target_currencies': 'USD'}, headers={'Accept': 'text/event-stream'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+            events = aiter(response.streaming_content)
+            self.assertTrue((await anext(events)).startswith(b'retry:'))
+            self.assertIn(b'"date": "2024-01-02"', await anext(events))
+
+            get_broker().publish([rate_update('EUR', 'USD', '2024-01-03', '1.2')])
+            self.assertEqual(await anext(events), format_event('rate', rate_update('EUR', 'USD', '2024-01-03', '1.2'))
+                             .encode())
+
+    def test_stream_requires_asgi(self):
+        """Test that the stream is refused under WSGI, where it would tie up a worker."""
+        response = APIClient().get(reverse('currency-rates-stream'), {'source_currency': 'EUR'})
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+    def test_ingest_publishes_after_commit(self):
+        """Test that stored rates are published only once the transaction commits."""
+        with patch('exchange_app.pubsub._broker', MagicMock()) as broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk_insert_exchange_rates([ExchangeRate(base_currency=self.eur, target_currency=self.usd,
+                                                         date='2024-01-03', rate=1.2)])
+                broker.publish.assert_not_called()
+            broker.publish.assert_called_once_with([rate_update('EUR', 'USD', '2024-01-03', 1.2)])
+
+class GapFillTests(TestCase):
+    """
+    Unit tests for filling missing dates (weekends, holidays) after ingest.
+    """
+    def setUp(self):
+        reset_caches()
+        self.eur = Currency.objects.create(code='EUR')
+        self.usd = Currency.objects.create(code='USD')
+        # Friday and Monday only
+        for day, rate in ((date(2024, 1, 5), '1.100000'), (date(2024, 1, 8), '1.130000')):
+            ExchangeRate.objects.create(base_currency=self.eur, target_currency=self.usd, date=day, rate=Decimal(rate))
+
+    def weekend(self):
+        return list(ExchangeRate.objects.filter(date__in=[date(2024, 1, 6), date(2024, 1, 7)])
+                    .order_by('date').values_list('rate', 'source'))
+
+    def test_carry_forward_and_interpolation(self):
+        """Test that weekend cells are filled with Friday's rate or interpolated towards Monday's."""
+        self.assertEqual(fill_gaps(['2024-01-08'], strategy='carry_forward'), [date(2024, 1, 6), date(2024, 1, 7)])
+        self.assertEqual(self.weekend(), [(Decimal('1.1'), 'carry_forward')] * 2)
+
+        fill_gaps(['2024-01-08'], strategy='interpolate')
+        self.assertEqual(self.weekend(), [(Decimal('1.11'), 'interpolated'), (Decimal('1.12'), 'interpolated')])
+        self.assertEqual(fill_gaps(['2024-01-08'], strategy='interpolate'), [])
+
+    def test_gaps_beyond_lookback_are_left_empty(self):
+        """Test that a pair without a recent provider rate is not filled."""
+        self.assertEqual(fill_gaps(['2024-01-20'], lookback=3), [])
+        self.assertEqual(ExchangeRate.objects.count(), 2)
+
+    def test_provider_rate_replaces_filled_rate(self):
+        """Test that a late provider rate overwrites the rate filled in for its date."""
+        fill_gaps(['2024-01-08'])
+        bulk_insert_exchange_rates([ExchangeRate(base_currency=self.eur, target_currency=self.usd,
+                                                 date=date(2024, 1, 6), rate=Decimal('1.5'))])
+        self.assertEqual(self.weekend()[0], (Decimal('1.5'), 'provider'))
+
+    def test_provider_rate_committed_after_read_is_kept(self):
+        """Test that a provider rate stored by a concurrent ingest after the window was read is not overwritten."""
+        fill_gaps(['2024-01-08'], strategy='carry_forward')
+        fill_value = gapfill._fill_value
+
+        def store_concurrently(known_dates, known_rates, day, *args):
+            # The tasks of the 6th and 7th commit their provider rates between the read and the write
+            bulk_insert_exchange_rates([ExchangeRate(base_currency=self.eur, target_currency=self.usd,
+                                                     date=day, rate=Decimal('1.5'))])
+            return fill_value(known_dates, known_rates, day, *args)
+
+        ExchangeRate.objects.filter(date=date(2024, 1, 7)).delete()  # The 6th is updated, the 7th inserted
+        with patch('exchange_app.gapfill._fill_value', side_effect=store_concurrently):
+            fill_gaps(['2024-01-08'], strategy='interpolate')
+        self.assertEqual(self.weekend(), [(Decimal('1.5'), 'provider')] * 2)
+
+    @patch('exchange_app.views.get_exchange_rate_data')
+    def test_convert_uses_filled_rate_without_provider_call(self, mock_get_rate):
+        """Test that converting on a non-trading day is served from the filled rate."""
+        ExchangeRate.objects.create(base_currency=self.eur, target_currency=self.usd,
+                                    date=date.today() - timedelta(days=1), rate=Decimal('1.25'))
+        fill_gaps([date.today()])
+
+        response = APIClient().get(reverse('convert-currency'), {
+            'source_currency': 'EUR', 'exchanged_currency': 'USD', 'amount': 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['converted_amount'], 125.0)
+        mock_get_rate.assert_not_called()
+
+class RateCacheTests(TestCase):
+    """
+    Unit tests for warming the rate caches with the most requested pairs.
+    """
+    def setUp(self):
+        reset_caches()
+        eur = Currency.objects.create(code='EUR')
+        usd = Currency.objects.create(code='USD')
+        Currency.objects.create(code='GBP')
+        ExchangeRate.objects.create(base_currency=eur, target_currency=usd, date=date.today(), rate=Decimal('1.08'))
+
+    @patch('exchange_app.views.get_exchange_rate_data')
+    @patch('exchange_app.ratecache.get_exchange_rate_data', return_value=0.85)
+    def test_warmed_hot_pairs_are_served_from_memory(self, mock_warm_rate, mock_view_rate):
+        """Test that the most requested pairs are warmed and conversions of them skip the database and providers."""
+        for _ in range(3):
+            record_pair_request('EUR', 'USD')
+        record_pair_request('EUR', 'GBP')
+
+        self.assertEqual(warm_rate_caches(), 2)
+        self.assertEqual(hot_pairs(), [('EUR', 'USD'), ('EUR', 'GBP')])
+        mock_warm_rate.assert_called_once_with('EUR', 'GBP', str(date.today()))
+
+        hits = CACHE_REQUESTS.value(cache='rate_snapshot', result='hit')
+        get_registry()
+        with self.assertNumQueries(0):  # Currency codes come from the registry
+            response = APIClient().get(reverse('convert-currency'), {
+                'source_currency': 'EUR', 'exchanged_currency': 'GBP', 'amount': 100})
+        self.assertEqual(response.data['converted_amount'], 85.0)
+        self.assertEqual(CACHE_REQUESTS.value(cache='rate_snapshot', result='hit'), hits + 1)
+        mock_view_rate.assert_not_called()
+
+class ProviderReplayTests(TestCase):
+    """
+    Unit tests for recorded provider responses, the replaying stub server and provider retries.
+    """
+    def setUp(self):
+        reset_caches()
+        self.cassette = Cassette()
+        self.cassette.record('EUR', '2024-01-02', 200, {'meta': {'code': 200}, 'rates': {'USD': 1.1}}, 12.5)
+
+    def test_stub_replays_cassette_and_rate_limits(self):
+        """Test that the stub answers recorded payloads and 429 with Retry-After once over its rate limit."""
+        with StubCurrencyBeaconServer(cassette=self.cassette, rate_limit=1, retry_after=3) as stub:
+            url = f'{stub.url}/historical'
+            params = {'base': 'EUR', 'date': '2024-01-02'}
+            self.assertEqual(requests.get(url, params=params).json()['rates'], {'USD': 1.1})
+            limited = requests.get(url, params=params)
+        self.assertEqual((limited.status_code, limited.headers['Retry-After']), (429, '3'))
+        self.assertEqual(LatencyDistribution.parse('recorded', self.cassette).sample(random.Random(1)), 0.0125)
+
+    def test_failing_provider_is_retried_then_falls_back(self):
+        """Test that server errors are retried and the chain then falls back to the deterministic mock."""
+        Provider.objects.create(name='CurrencyBeacon', priority=1)
+        Provider.objects.create(name='Mock', priority=2)
+        with StubCurrencyBeaconServer(['EUR', 'USD'], error_rate=1.0) as stub, \
+                override_settings(CURRENCYBEACON_API_URL=stub.url, CURRENCYBEACON_API_KEY='test',
+                                  CURRENCYBEACON_MAX_RETRIES=2, CURRENCYBEACON_MAX_RETRY_WAIT=0):
+            rate = get_exchange_rate_data('EUR', 'USD', '2024-01-02')
+        self.assertEqual(stub.responses[500], 3)
+        self.assertEqual(rate, MockProvider().get_exchange_rate('EUR', 'USD', '2024-01-02'))
+
+    def test_request_time_lookups_stay_within_retry_budget(self):
+        """Test that retries stop once their waits would exceed the budget, e.g. while serving a conversion."""
+        Provider.objects.create(name='CurrencyBeacon', priority=1)
+        Provider.objects.create(name='Mock', priority=2)
+        Currency.objects.create(code='EUR')
+        Currency.objects.create(code='USD')
+        with StubCurrencyBeaconServer(['EUR', 'USD'], error_rate=1.0) as stub, \
+                override_settings(CURRENCYBEACON_API_URL=stub.url, CURRENCYBEACON_API_KEY='test',
+                                  CURRENCYBEACON_MAX_RETRIES=2, CURRENCYBEACON_REQUEST_RETRY_BUDGET=0), \
+                patch('exchange_app.utility.time.sleep') as sleep:
+            rate = get_exchange_rate_data('EUR', 'USD', '2024-01-02', retry_budget=0.25)
+            self.assertEqual(stub.responses[500], 2)  # Backoff of 0.1s fits, the following 0.2s does not
+            response = APIClient().get(reverse('convert-currency'), {
+                'source_currency': 'EUR', 'exchanged_currency': 'USD', 'amount': 100})
+            self.assertEqual(stub.responses[500], 3)
+        self.assertEqual(rate, MockProvider().get_exchange_rate('EUR', 'USD', '2024-01-02'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list if c.args[0]], [0.1])  # The stub itself sleeps 0s
+
+    def test_missing_api_key_falls_back_without_request(self):
+        """Test that CurrencyBeacon is skipped when no API key is configured."""
+        Provider.objects.create(name='CurrencyBeacon', priority=1)
+        Provider.objects.create(name='Mock', priority=2)
+        with StubCurrencyBeaconServer(['EUR', 'USD']) as stub, \
+                override_settings(CURRENCYBEACON_API_URL=stub.url, CURRENCYBEACON_API_KEY=''):
+            rate = get_exchange_rate_data('EUR', 'USD', '2024-01-02')
+        self.assertEqual(sum(stub.responses.values()), 0)
+        self.assertEqual(rate, MockProvider().get_exchange_rate('EUR', 'USD', '2024-01-02'))
+
+    def test_replay_provider_reads_cassette(self):
+        """Test that the replay provider answers from a saved cassette without network I/O."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cassette.json')
+            self.cassette.save(path)
+            with override_settings(PROVIDER_CASSETTE=path):
+                self.assertEqual(ReplayProvider().get_exchange_rate('EUR', 'USD', '2024-01-02'), 1.1)
+                self.assertIsNone(ReplayProvider().get_exchange_rate('EUR', 'USD', '2024-01-03'))
+
+class CurrencyRegistryTests(TestCase):
+    """
+    Unit tests for the in-memory currency registry.
+    """
+    def setUp(self):
+        reset_caches()
+        self.eur = Currency.objects.create(code='EUR')
+        self.usd = Currency.objects.create(code='USD')
+
+    def test_lookups_are_served_from_memory_and_refreshed_on_save_and_delete(self):
+        """Test that codes and ids resolve without queries once loaded and follow Currency saves and deletes."""
+        get_registry()
+        with self.assertNumQueries(0):
+            self.assertEqual(currency_id('EUR'), self.eur.id)
+            self.assertEqual(currency_code(self.usd.id), 'USD')
+
+        gbp = Currency.objects.create(code='GBP')
+        self.assertEqual(currency_id('GBP'), gbp.id)
+        self.usd.delete()
+        self.assertIsNone(currency_id('USD'))
+        self.assertNotIn('USD', get_registry())
+
+    def test_other_processes_are_picked_up_by_version_and_fallback(self):
+        """Test that a bumped version key reloads the registry and that unknown codes are checked in the database."""
+        registry = get_registry()
+        # Rows written by another process send no signals here
+        Currency.objects.bulk_create([Currency(code='CHF')])
+        with override_settings(CURRENCY_REGISTRY_CHECK_SECONDS=0):
+            self.assertIs(get_registry(), registry)
+            cache.set(VERSION_KEY, 'bumped elsewhere')
+            self.assertIn('CHF', get_registry())
+
+        Currency.objects.bulk_create([Currency(code='JPY')])
+        with self.assertNumQueries(2):  # Existence check and reload
+            self.assertIsNotNone(currency_id('JPY'))
+        with self.assertNumQueries(1):  # Unknown codes cost one existence check
+            self.assertIsNone(currency_id('XYZ'))
+
+    def test_rate_list_queries_do_not_grow_with_rows(self):
+        """Test that serializing exchange rates does not query currencies per row."""
+        for offset, code in enumerate(['GBP', 'CHF', 'INR', 'CNY']):
+            ExchangeRate.objects.create(base_currency=self.eur, target_currency=Currency.objects.create(code=code),
+                                        rate=Decimal('1.1'), date=date(2024, 1, 1 + offset))
+        get_registry()
+        with self.assertNumQueries(2):  # Packed blocks and daily rates
+            response = APIClient().get(reverse('currency-rates-list'), {
+                'source_currency': 'EUR', 'date_from': '2024-01-01', 'date_to': '2024-01-31'})
+        self.assertEqual([row['target_currency'] for row in response.data], ['GBP', 'CHF', 'INR', 'CNY'])
+        self.assertEqual({row['base_currency'] for row in response.data}, {'EUR'})
+
+class BulkAdministrationTests(TestCase):
+    """
+    Unit tests for the bulk currency/provider endpoints and reference data invalidation.
+    """
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.events = []
+        reference_data_changed.connect(self.record_event)
+        self.addCleanup(reference_data_changed.disconnect, self.record_event)
+
+    def record_event(self, sender, **kwargs):
+        self.events.append(sender)
+
+    def test_bulk_create_currencies_in_one_transaction(self):
+        """Test that currencies are created with one check and one insert, and announced once."""
+        Currency.objects.create(code='EUR')
+        self.events.clear()
+
+        with self.assertNumQueries(4):  # Uniqueness check, savepoint, insert, release
+            response = self.client.post(reverse('currency-bulk'), [{'code': 'USD'}, {'code': 'GBP'}, {'code': 'CHF'}],
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([row['code'] for row in response.data], ['USD', 'GBP', 'CHF'])
+        self.assertEqual(self.events, [Currency])
+        self.assertEqual(currency_id('CHF'), Currency.objects.get(code='CHF').id)
+
+        response = self.client.post(reverse('currency-bulk'), [{'code': 'JPY'}, {'code': 'EUR'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'code already exists: EUR')
+        response = self.client.post(reverse('currency-bulk'), [{'code': 'JPY'}, {'code': 'JPY'}], format='json')
+        self.assertEqual(response.data['error'], 'Duplicate code: JPY')
+        self.assertFalse(Currency.objects.filter(code='JPY').exists())
+
+    def test_bulk_update_rejects_swapped_codes(self):
+        """Test that swapping codes between currencies is rejected before the update, keeping unchanged codes valid."""
+        first = Currency.objects.create(code='AAA')
+        second = Currency.objects.create(code='BBB')
+
+        response = self.client.patch(reverse('currency-bulk'), [{'id': first.id, 'code': 'BBB'},
+                                                                {'id': second.id, 'code': 'AAA'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'code already exists: AAA, BBB')
+        self.assertEqual(Currency.objects.get(id=first.id).code, 'AAA')
+
+        response = self.client.patch(reverse('currency-bulk'), [{'id': first.id, 'code': 'AAA'},
+                                                                {'id': second.id, 'code': 'CCC'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Currency.objects.get(id=second.id).code, 'CCC')
+
+    def test_bulk_update_providers_reranks_provider_chain(self):
+        """Test that providers are re-ranked with one update and the cached provider chain follows."""
+        beacon = Provider.objects.create(name='CurrencyBeacon', priority=1)
+        mock = Provider.objects.create(name='Mock', priority=2)
+        self.assertEqual(provider_chain(), ('CurrencyBeacon', 'Mock'))
+        self.events.clear()
+
+        with self.assertNumQueries(4):  # Ids, savepoint, update, release (names are unchanged)
+            response = self.client.patch(reverse('provider-bulk'), [
+                {'id': beacon.id, 'priority': 2}, {'id': mock.id, 'priority': 1}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.events, [Provider])
+        self.assertEqual(provider_chain(), ('Mock', 'CurrencyBeacon'))
+
+        response = self.client.patch(reverse('provider-bulk'), [{'id': 999, 'is_active': False}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_admin_action_invalidates_provider_chain(self):
+        """Test that deactivating providers in the admin drops the cached provider chain."""
+        Provider.objects.create(name='CurrencyBeacon', priority=1)
+        Provider.objects.create(name='Mock', priority=2)
+        self.assertEqual(provider_chain(), ('CurrencyBeacon', 'Mock'))
+
+        ProviderAdmin(Provider, admin.site).deactivate_providers(None, Provider.objects.filter(name='Mock'))
+        self.assertEqual(provider_chain(), ('CurrencyBeacon',))
+
+class HistoricalConversionTests(TestCase):
+    """
+    Unit tests for bulk conversion of records at historical rates.
+    """
+    def setUp(self):
+        reset_caches()
+        self.eur = Currency.objects.create(code='EUR')
+        self.usd = Currency.objects.create(code='USD')
+        self.gbp = Currency.objects.create(code='GBP')
+        ExchangeRate.objects.create(base_currency=self.usd, target_currency=self.eur, date=date(2024, 3, 1),
+                                    rate=Decimal('0.920000'))
+        # Only stored the other way round, converted with the inverse rate
+        ExchangeRate.objects.create(base_currency=self.eur, target_currency=self.gbp, date=date(2024, 3, 1),
+                                    rate=Decimal('0.800000'))
+
+    def test_csv_upload_is_converted_with_one_rate_query(self):
+        """Test that a CSV upload is converted per record date with direct, inverse and identity rates."""
+        upload = ("id,amount,currency,date\n"
+                  "1,100.10,USD,2024-03-01\n"
+                  "2,50,GBP,2024-03-01\n"
+                  "3,10,EUR,2024-03-02\n"
+                  "4,10,USD,2024-03-02\n"
+                  "5,abc,USD,2024-03-01\n")
+        get_registry()
+        with self.assertNumQueries(2):  # Daily rates, compacted months for the pair without a daily rate
+            response = self.client.post(reverse('convert-historical') + '?reporting_currency=EUR', upload,
+                                        content_type='text/csv')
+            rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual([(row['id'], row['converted_amount'], row['error']) for row in rows], [
+            ('1', '92.092000', ''),
+            ('2', '62.500000', ''),
+            ('3', '10.000000', ''),
+            ('4', '', 'No exchange rate available'),
+            ('5', '', 'Invalid amount'),
+        ])
+        self.assertEqual(rows[1]['rate'], '1.250000')
+
+    async def test_asgi_response_is_streamed(self):
+        """Test that under ASGI the conversion is streamed chunk by chunk instead of buffered."""
+        upload = "amount,currency,date\n100.10,USD,2024-03-01\n50,GBP,2024-03-01\n10,EUR,2024-03-02\n"
+        response = await self.async_client.post(reverse('convert-historical') + '?reporting_currency=EUR&chunk_size=1',
+                                                upload, content_type='text/csv')
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.DictReader(b''.join(chunks).decode().splitlines()))
+        self.assertEqual([row['converted_amount'] for row in rows], ['92.092000', '62.500000', '10.000000'])
+
+    def test_csv_with_byte_order_mark(self):
+        """Test that CSV input starting with a UTF-8 byte order mark (Excel "CSV UTF-8") is converted."""
+        upload = '\ufeffamount,currency,date\n100.10,USD,2024-03-01\n'.encode('utf-8')
+        response = self.client.post(reverse('convert-historical') + '?reporting_currency=EUR', upload,
+                                    content_type='text/csv')
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([(row['amount'], row['converted_amount']) for row in rows], [('100.10', '92.092000')])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'bookings.csv')
+            with open(path, 'wb') as handle:
+                handle.write(upload)
+            output = StringIO()
+            call_command('convert_historical', path, stdout=output, stderr=StringIO())
+            with patch('sys.stdin', io.TextIOWrapper(io.BytesIO(upload))):
+                call_command('convert_historical', '-', stdout=output, stderr=StringIO())
+        rows = list(csv.reader(output.getvalue().splitlines()))
+        self.assertEqual(rows[0], rows[2])
+        self.assertEqual(rows[0][0], 'amount')
+        self.assertEqual([rows[1][5], rows[3][5]], ['92.092000'] * 2)
+
+    def test_ndjson_command_reuses_rates_across_chunks(self):
+        """Test that the command streams NDJSON in chunks and looks each (currency, date) up only once."""
+        records = [{'amount': 0.1, 'currency': 'USD', 'date': '2024-03-01', 'ref': index} for index in range(5)]
+        records.append({'amount': 1, 'currency': 'XYZ', 'date': '2024-03-01'})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'bookings.ndjson')
+            with open(path, 'w') as handle:
+                handle.write(''.join(json.dumps(record) + '\n' for record in records) + 'not json\n')
+
+            output = StringIO()
+            get_registry()
+            with self.assertNumQueries(2):  # Daily rates once, the unknown currency once
+                call_command('convert_historical', path, reporting_currency='EUR', chunk_size=2, stdout=output,
+                             stderr=StringIO())
+
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([row['converted_amount'] for row in rows[:5]], ['0.092000'] * 5)
+        self.assertEqual([{key: row[key] for key in records[0]} for row in rows[:5]], records[:5])  # Fields round-trip
+        self.assertIsInstance(rows[0]['amount'], float)
+        self.assertEqual([row['error'] for row in rows[5:]], ['Invalid currency code', 'Invalid record'])
+
+    def test_ndjson_fields_are_written_back_exactly(self):
+        """Test that NDJSON input fields come back as sent, including high-precision and out-of-range numbers."""
+        lines = ['{"amount": 12345678901234567.89, "currency": "USD", "date": "2024-03-01", "tags": [1.50]}\n',
+                 '{"amount": 1e400, "currency": "USD", "date": "2024-03-01"}\n',
+                 '{"amount": 2, "currency": "USD", "date": "2024-03-01", "rate": 0.5}\n']
+        output = ''.join(write_records(convert_records(read_records(lines, 'ndjson'), 'EUR'), 'ndjson')).splitlines()
+
+        self.assertTrue(output[0].startswith(lines[0].rstrip()[:-1] + ', "reporting_currency": "EUR"'))
+        self.assertEqual(json.loads(output[0])['converted_amount'], '11358024589135802.458800')
+        self.assertTrue(output[1].startswith(lines[1].rstrip()[:-1]))
+        self.assertEqual(json.loads(output[1])['error'], 'Invalid amount')
+        # An input field named like an output field is replaced, the other fields keep their numbers
+        self.assertEqual(json.loads(output[2], parse_float=Decimal),
+                         {'amount': 2, 'currency': 'USD', 'date': '2024-03-01', 'rate': '0.920000',
+                          'reporting_currency': 'EUR', 'converted_amount': '1.840000', 'error': None})
+
+    def test_compacted_rates_and_invalid_reporting_currency(self):
+        """Test that compacted months are converted and an unknown reporting currency is rejected."""
+        compact_exchange_rates(cutoff=date(2024, 4, 1))
+        self.assertFalse(ExchangeRate.objects.exists())
+
+        chunks = convert_records([{'amount': '2', 'currency': 'EUR', 'date': '2024-03-01'}], 'USD')
+        self.assertEqual(next(chunks)[0]['converted_amount'], '2.173913')
+
+        response = self.client.post(reverse('convert-historical') + '?reporting_currency=XYZ', '',
+                                    content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Invalid reporting currency')
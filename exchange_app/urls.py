@@ -12,10 +12,22 @@ urlpatterns = [
     path('currency-rates/list', CurrencyRateListView.as_view(), name='currency-rates-list'),
     path('exchange-rates/pagination', PaginatedExchangeRateListView.as_view(), name='paginated_exchange_rate_list'),
 
+    # API to get min/max/mean/stddev/OHLC statistics per day, week or month
+    path('currency-rates/aggregate', RateAggregationView.as_view(), name='currency-rates-aggregate'),
+
+    # Server-Sent Events stream of newly stored rates
+    path('currency-rates/stream', RateStreamView.as_view(), name='currency-rates-stream'),
+
     # API to convert currency based on latest exchange rate
     path('convert/', ConvertAmountView.as_view(), name='convert-currency'),
     path('currency/load-historical-rates/', LoadHistoricalRatesView.as_view(), name='load-historical-rates'),
+
+    # API to convert CSV/NDJSON records into a reporting currency at historical rates
+    path('convert/historical', HistoricalConversionView.as_view(), name='convert-historical'),
     
+    # Prometheus metrics
+    path('metrics', MetricsView.as_view(), name='metrics'),
+
     # Including ViewSets (Currency & Provider)
     path('', include(router.urls)),
 ]
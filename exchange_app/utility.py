@@ -1,16 +1,32 @@
 from abc import ABC, abstractmethod
+import logging
 import random
+import threading
+import time
 import requests
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from datetime import date
+from .cassette import load_cassette
+from .metrics import PROVIDER_ERRORS, PROVIDER_REQUEST_SECONDS, PROVIDER_RETRIES
 from .models import Provider
+from .profiling import section
+
+logger = logging.getLogger(__name__)
 
 class ExchangeRateProvider(ABC):
     """
     Abstract base class for currency exchange rate providers.
     All providers must implement the `get_exchange_rate` method.
     """
-    
+
+    def __init__(self, retry_budget=None):
+        """
+        :param retry_budget: Seconds a lookup may spend waiting between retries, None for the configured retry policy
+        """
+        self.retry_budget = retry_budget
+
     @abstractmethod
     def get_exchange_rate(self, source_currency, exchanged_currency, valuation_date):
         """
@@ -23,47 +39,197 @@ class ExchangeRateProvider(ABC):
         """
         pass
 
+class ProviderError(Exception):
+    """
+    Raised when a provider fails (server errors, exhausted rate limit retries),
+    so the provider chain records the error and falls back to the next provider.
+    """
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def provider_session():
+    """
+    HTTP session shared by all threads of the process, so connections to the
+    provider are pooled and reused instead of opened per request.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=getattr(settings, 'CURRENCYBEACON_POOL_SIZE', 10))
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
 class CurrencyBeaconProvider(ExchangeRateProvider):
     """
     Exchange rate provider that integrates with the CurrencyBeacon API.
     """
-    
+    name = 'CurrencyBeacon'
+
     def get_exchange_rate(self, source_currency, exchanged_currency, valuation_date):
         """
         Retrieves the exchange rate from CurrencyBeacon API for a given currency pair.
+        Rate limited (429) and server error (5xx) responses are retried up to
+        `CURRENCYBEACON_MAX_RETRIES` times, honouring `Retry-After`, unless the
+        waits would exceed the provider's `retry_budget`.
         
         :param source_currency: The base currency (e.g., "EUR")
         :param exchanged_currency: The target currency (e.g., "USD")
         :param valuation_date: The date for which the exchange rate is requested
         :return: Exchange rate as a float or None if unavailable
+        :raises ProviderError: When the API key is not set or the API keeps failing
         """
         api_key = settings.CURRENCYBEACON_API_KEY  # API key stored in Django settings
-        url = f"https://api.currencybeacon.com/v1/historical?api_key={api_key}&base={source_currency}&date={valuation_date}"
-        response = requests.get(url)
+        if not api_key:
+            raise ProviderError("CURRENCYBEACON_API_KEY is not set")
+        url = f"{settings.CURRENCYBEACON_API_URL}/historical?api_key={api_key}&base={source_currency}&date={valuation_date}"
+        max_retries = getattr(settings, 'CURRENCYBEACON_MAX_RETRIES', 2)
+        waited = 0
+
+        for attempt in range(max_retries + 1):
+            response = provider_session().get(url, timeout=getattr(settings, 'CURRENCYBEACON_TIMEOUT', 5))
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            delay = self.retry_delay(response, attempt)
+            if attempt == max_retries or (self.retry_budget is not None and waited + delay > self.retry_budget):
+                raise ProviderError(f"CurrencyBeacon answered {response.status_code} after {attempt + 1} attempts")
+            PROVIDER_RETRIES.inc(provider=self.name, status=str(response.status_code))
+            time.sleep(delay)
+            waited += delay
+
+        if response.status_code != 200:
+            return None  # Client errors, e.g. an unsupported currency or date
         data = response.json()
         
         return data.get('rates', {}).get(exchanged_currency, None)
 
+    @staticmethod
+    def retry_delay(response, attempt):
+        """
+        Seconds to wait before retrying: `Retry-After` when sent, exponential backoff
+        otherwise, capped at `CURRENCYBEACON_MAX_RETRY_WAIT`.
+        """
+        try:
+            delay = float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            delay = 0.1 * 2 ** attempt
+        return min(delay, getattr(settings, 'CURRENCYBEACON_MAX_RETRY_WAIT', 5))
+
 class MockProvider(ExchangeRateProvider):
     """
-    Mock exchange rate provider that generates random exchange rates.
-    Useful for testing purposes.
+    Mock exchange rate provider that generates deterministic pseudo-random
+    exchange rates, seeded by the currency pair and date so that repeated runs
+    return the same rates. Useful for testing purposes.
     """
     
     def get_exchange_rate(self, source_currency, exchanged_currency, valuation_date):
         """
-        Generates a random exchange rate for testing.
+        Generates a mock exchange rate for testing.
         
         :param source_currency: The base currency (e.g., "EUR")
         :param exchanged_currency: The target currency (e.g., "USD")
         :param valuation_date: The date for which the exchange rate is requested
-        :return: Randomly generated exchange rate as a float
+        :return: Mock exchange rate as a float, always the same for the same arguments
+        """
+        rng = random.Random(f"{source_currency}:{exchanged_currency}:{valuation_date}")
+        return round(rng.uniform(0.5, 1.5), 4)
+
+class ReplayProvider(ExchangeRateProvider):
+    """
+    Provider answering from a recorded cassette (see `record_provider_responses`)
+    without any network I/O, for deterministic offline runs.
+    The cassette is read from `PROVIDER_CASSETTE`.
+    """
+
+    def get_exchange_rate(self, source_currency, exchanged_currency, valuation_date):
+        """
+        Looks the exchange rate up in the recorded CurrencyBeacon payloads.
+
+        :param source_currency: The base currency (e.g., "EUR")
+        :param exchanged_currency: The target currency (e.g., "USD")
+        :param valuation_date: The date for which the exchange rate is requested
+        :return: Recorded exchange rate as a float or None if it was not recorded
         """
-        # Generate a random mock exchange rate
-        return round(random.uniform(0.5, 1.5), 4)  
+        interaction = load_cassette(settings.PROVIDER_CASSETTE).get(source_currency, valuation_date)
+        if interaction is None or interaction['status'] != 200:
+            return None
+        return interaction['body'].get('rates', {}).get(exchanged_currency, None)
+
+# Provider implementations by lower-cased `Provider.name`; unknown names use the mock provider
+PROVIDER_CLASSES = {
+    'currencybeacon': CurrencyBeaconProvider,
+    'replay': ReplayProvider,
+    'mock': MockProvider,
+}
+
+def get_provider_class(name):
+    """
+    :param name: Name of a `Provider` row
+    :return: The ExchangeRateProvider implementation for it
+    """
+    return PROVIDER_CLASSES.get(name.lower(), MockProvider)
+
+
+PROVIDER_CHAIN_VERSION_KEY = 'exchange_app:provider-chain:version'
+
+# Active provider names of this process, replaced when providers change here (see
+# `exchange_app.signals`) or when another process bumped the version key in the
+# shared cache, which is checked at most every PROVIDER_CHAIN_CHECK_SECONDS.
+_provider_chain = None
+_provider_chain_checked_at = None
+_provider_chain_lock = threading.Lock()
+
+
+def provider_chain():
+    """
+    :return: Names of the active providers, highest priority first
+    """
+    global _provider_chain, _provider_chain_checked_at
+    chain = _provider_chain
+    now = time.monotonic()
+    if chain is not None and now - _provider_chain_checked_at < getattr(settings, 'PROVIDER_CHAIN_CHECK_SECONDS', 30):
+        return chain[1]
 
+    with _provider_chain_lock:
+        version = cache.get(PROVIDER_CHAIN_VERSION_KEY)
+        if _provider_chain is None or _provider_chain[0] != version:
+            names = Provider.objects.filter(is_active=True).order_by('priority').values_list('name', flat=True)
+            _provider_chain = (version, tuple(names))
+        _provider_chain_checked_at = now
+        return _provider_chain[1]
 
-def get_exchange_rate_data(source_currency, exchanged_currency, valuation_date):
+
+def clear_provider_chain():
+    """
+    Drops this process's provider chain only, e.g. after a rolled back
+    transaction (tests) that changed providers without sending signals.
+    """
+    global _provider_chain
+    _provider_chain = None
+
+
+def invalidate_provider_chain():
+    """
+    Drops this process's provider chain and, once the transaction commits, tells
+    the other processes to reload theirs.
+    """
+    global _provider_chain
+
+    def bump_version():
+        global _provider_chain
+        cache.set(PROVIDER_CHAIN_VERSION_KEY, time.time_ns(), timeout=None)
+        _provider_chain = None
+
+    _provider_chain = None
+    transaction.on_commit(bump_version)
+
+
+def get_exchange_rate_data(source_currency, exchanged_currency, valuation_date, retry_budget=None):
     """
     Retrieves the exchange rate from the highest-priority active provider.
     If no provider returns a valid exchange rate, it returns None.
@@ -71,20 +237,31 @@ def get_exchange_rate_data(source_currency, exchanged_currency, valuation_date):
     :param source_currency: The base currency (e.g., "EUR")
     :param exchanged_currency: The target currency (e.g., "USD")
     :param valuation_date: The date for which the exchange rate is requested
+    :param retry_budget: Seconds each provider may wait between retries (request-time lookups);
+                         None keeps the full retry policy (ingest tasks)
     :return: Exchange rate as a float or None if no provider returns a valid rate
     """
     
-    # Fetch all active providers sorted by priority (ascending order)
-    providers = Provider.objects.filter(is_active=True).order_by('priority')
-    
-    for provider in providers:
+    # Active providers sorted by priority (ascending order), kept in memory between calls
+    for provider_name in provider_chain():
         # Dynamically select the provider class based on provider name
-        provider_class = CurrencyBeaconProvider if provider.name.lower() == 'currencybeacon' else MockProvider
-        provider_instance = provider_class()
-        
-        # Attempt to get exchange rate from provider
-        rate = provider_instance.get_exchange_rate(source_currency, exchanged_currency, valuation_date)
+        provider_instance = get_provider_class(provider_name)(retry_budget=retry_budget)
         
+        # Attempt to get exchange rate from provider, falling back to the next one on failure
+        started = time.perf_counter()
+        try:
+            with section('provider'):
+                rate = provider_instance.get_exchange_rate(source_currency, exchanged_currency, valuation_date)
+        except Exception:
+            PROVIDER_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider_name, result='error')
+            PROVIDER_ERRORS.inc(provider=provider_name)
+            logger.exception("Provider %s failed for %s/%s on %s",
+                             provider_name, source_currency, exchanged_currency, valuation_date)
+            continue
+
+        PROVIDER_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider_name,
+                                         result='miss' if rate is None else 'ok')
+
         if rate is not None:
             return rate  # Return the first valid rate found
     # Return None if no provider returns a valid exchange rate
@@ -1,16 +1,36 @@
+import codecs
+import logging
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views import View
 from django.utils.dateparse import parse_date
 from datetime import date
+from .aggregation import BUCKETS, aggregate_rates
+from .conversion import CONTENT_TYPES, FORMATS, convert_records, read_records, write_records
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS_REGISTRY
 from .models import ExchangeRate, Currency, Provider
-from .serializers import ExchangeRateSerializer, CurrencySerializer, ProviderSerializer
-from .tasks import *
+from .pubsub import get_broker, get_stream_settings, latest_rate_updates
+from .ratecache import cache_rate, cached_rate, record_pair_request
+from .registry import currency_id, get_registry
+from .renderers import EventStreamRenderer, FastJSONRenderer, format_event
+from .retention import RatesWithPacked, packed_exchange_rates
+from .serializers import (ExchangeRateSerializer, CurrencySerializer, ProviderSerializer, RateAggregateSerializer,
+                          CurrencyBulkSerializer, ProviderBulkSerializer)
+from .signals import reference_data_changed
 from .utility import get_exchange_rate_data
 import random
 
+logger = logging.getLogger(__name__)
+
 class CurrencyRateListView(APIView):
     """
     API to retrieve exchange rates for a given source currency within a time range.
@@ -31,29 +51,23 @@ class CurrencyRateListView(APIView):
             if not date_from or not date_to:
                 return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
 
-            try:
-                source_currency = Currency.objects.get(code=source_currency_code)
-            except Currency.DoesNotExist:
+            source_currency_id = currency_id(source_currency_code)
+            if source_currency_id is None:
                 return Response({'error': 'Invalid source currency'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Debugging statements
-            print(f"Source Currency: {source_currency.code}, Date From: {date_from}, Date To: {date_to}")
+            logger.debug("Source Currency: %s, Date From: %s, Date To: %s", source_currency_code, date_from, date_to)
 
-            # Fetch exchange rates within the date range
-            rates = ExchangeRate.objects.filter(
-                base_currency=source_currency, 
+            # Fetch exchange rates within the date range, compacted months first
+            rates = packed_exchange_rates(source_currency_id, date_from, date_to) + list(ExchangeRate.objects.filter(
+                base_currency_id=source_currency_id, 
                 date__range=[date_from, date_to]
-            )
+            ))
 
-            # print(f"Found {rates.count()} rates")
-
-            if not rates.exists():
+            if not rates:
                 return Response({'message': 'No exchange rates found for the given criteria'}, status=status.HTTP_404_NOT_FOUND)
 
             serializer = ExchangeRateSerializer(rates, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
-        except Currency.DoesNotExist:
-            return Response({'error': 'Invalid source currency'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -70,22 +84,73 @@ class PaginatedExchangeRateListView(APIView):
             if not date_from or not date_to:
                 return Response({'error': 'Both date_from and date_to are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-            try:
-                source_currency = Currency.objects.get(code=source_currency_code)
-            except Currency.DoesNotExist:
+            date_from = parse_date(date_from)
+            date_to = parse_date(date_to)
+
+            if not date_from or not date_to:
+                return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+            source_currency_id = currency_id(source_currency_code)
+            if source_currency_id is None:
                 return Response({'error': 'Invalid source currency'}, status=status.HTTP_400_BAD_REQUEST)
 
             rates = ExchangeRate.objects.filter(
-                base_currency=source_currency,
+                base_currency_id=source_currency_id,
                 date__range=[date_from, date_to]
             )
 
+            # Compacted months come first, daily rows are still paged by the database
+            packed = packed_exchange_rates(source_currency_id, date_from, date_to)
+            if packed:
+                rates = RatesWithPacked(packed, rates.order_by('date', 'id'))
+
             paginator = PageNumberPagination()
             paginator.page_size = request.GET.get('page_size', 10)  # Default page size is 10
             result_page = paginator.paginate_queryset(rates, request)
             serializer = ExchangeRateSerializer(result_page, many=True)
 
-            return paginator.get_paginated_response(serializer.data, status=status.HTTP_200_OK)
+            return paginator.get_paginated_response(serializer.data)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class RateAggregationView(APIView):
+    """
+    API to retrieve exchange rate statistics (first/last/min/max/mean/stddev) of a
+    source currency per target currency and day, week or month, computed server side.
+    """
+    def get(self, request):
+        try:
+            source_currency_code = request.GET.get('source_currency', 'EUR')
+            target_currency_codes = [code.strip() for code in request.GET.get('target_currencies', '').split(',') if code.strip()]
+            bucket = request.GET.get('bucket', 'month')
+            date_from = parse_date(request.GET.get('date_from') or '')
+            date_to = parse_date(request.GET.get('date_to') or '')
+
+            if not date_from or not date_to:
+                return Response({'error': 'date_from and date_to are required (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+
+            if date_from > date_to:
+                return Response({'error': 'date_from must not be after date_to'}, status=status.HTTP_400_BAD_REQUEST)
+
+            if bucket not in BUCKETS:
+                return Response({'error': f"bucket must be one of {', '.join(BUCKETS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+            ids = [currency_id(code) for code in [source_currency_code, *target_currency_codes]]
+            if None in ids:
+                return Response({'error': 'Invalid currency code'}, status=status.HTTP_400_BAD_REQUEST)
+
+            buckets = aggregate_rates(ids[0], ids[1:], date_from, date_to, bucket)
+            codes = get_registry().codes
+            for row in buckets:
+                row['target_currency'] = codes[row['target_currency_id']]
+
+            return Response({
+                'source_currency': source_currency_code,
+                'bucket': bucket,
+                'date_from': date_from,
+                'date_to': date_to,
+                'results': RateAggregateSerializer(buckets, many=True).data,
+            })
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -100,23 +165,32 @@ class ConvertAmountView(APIView):
             exchanged_currency_code = request.GET.get('exchanged_currency', 'USD')
             amount = float(request.GET.get('amount', 1))
 
-            try:
-                source_currency = Currency.objects.get(code=source_currency_code)
-                exchanged_currency = Currency.objects.get(code=exchanged_currency_code)
-            except Currency.DoesNotExist:
+            source_currency_id = currency_id(source_currency_code)
+            exchanged_currency_id = currency_id(exchanged_currency_code)
+            if source_currency_id is None or exchanged_currency_id is None:
                 return Response({'error': 'Invalid currency code'}, status=status.HTTP_400_BAD_REQUEST)
 
-            providers = Provider.objects.filter(is_active=True).order_by('priority')
-            rate = None
-            
-            for provider in providers:
-                try:
-                    rate = get_exchange_rate_data(source_currency.code, exchanged_currency.code, str(date.today()), provider.name)
-                    if rate:
-                        break
-                except Exception:
-                    continue  # Try next provider if one fails
-            
+            today = date.today()
+            record_pair_request(source_currency_code, exchanged_currency_code)
+
+            # Warmed/cached rate first, then today's stored rate (provider or filled in),
+            # otherwise the active providers by priority
+            rate = cached_rate(source_currency_code, exchanged_currency_code, today)
+            if rate is None:
+                rate = ExchangeRate.objects.filter(
+                    base_currency_id=source_currency_id,
+                    target_currency_id=exchanged_currency_id,
+                    date=today
+                ).values_list('rate', flat=True).first()
+                if rate is None:
+                    # Within a small retry budget: a rate limited provider must not hold the worker
+                    rate = get_exchange_rate_data(source_currency_code, exchanged_currency_code, str(today),
+                                                  retry_budget=getattr(settings, 'CURRENCYBEACON_REQUEST_RETRY_BUDGET', 0.5))
+                if rate is not None:
+                    cache_rate(source_currency_code, exchanged_currency_code, today, rate)
+            if rate is not None:
+                rate = float(rate)
+
             if rate:
                 converted_amount = amount * rate
                 return Response({
@@ -131,19 +205,204 @@ class ConvertAmountView(APIView):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class CurrencyViewSet(viewsets.ModelViewSet):
+class HistoricalConversionView(APIView):
+    """
+    API converting a CSV or NDJSON upload of (amount, currency, date) records into a
+    reporting currency at each record's historical rate. Input is read and results
+    are streamed back in chunks, with one rate lookup per chunk.
+    """
+    def post(self, request):
+        reporting_currency = request.GET.get('reporting_currency', 'EUR')
+        fmt = request.GET.get('format') or ('ndjson' if 'ndjson' in request.content_type else 'csv')
+
+        if fmt not in FORMATS:
+            return Response({'error': f"format must be one of {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        chunk_size = request.GET.get('chunk_size', '')
+        if chunk_size and (not chunk_size.isdigit() or int(chunk_size) == 0):
+            return Response({'error': 'chunk_size must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            chunks = convert_records(read_records(codecs.iterdecode(request._request, 'utf-8-sig'), fmt),
+                                     reporting_currency, chunk_size=int(chunk_size) if chunk_size else None)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        content = write_records(chunks, fmt)
+        if isinstance(request._request, ASGIRequest):
+            content = iterate_in_thread(content)  # Django buffers synchronous iterators under ASGI
+        return StreamingHttpResponse(content, content_type=CONTENT_TYPES[fmt])
+
+
+async def iterate_in_thread(iterator):
     """
-    CRUD API for managing available currencies.
+    Async iterator over a synchronous one, so ASGI servers stream the response
+    instead of buffering it. Each item is produced in the synchronous thread,
+    where the ORM may be used.
+    """
+    try:
+        while (item := await sync_to_async(next)(iterator, None)) is not None:
+            yield item
+    finally:
+        await sync_to_async(iterator.close)()
+
+
+async def rate_events(source_currency_code, target_currency_codes):
+    """
+    Server-Sent Events of one subscription: the latest stored rates first, then every
+    changed rate as it is published, with heartbeat comments while idle.
+    """
+    stream_settings = get_stream_settings()
+    broker = get_broker()
+    subscription = broker.subscribe(source_currency_code, target_currency_codes)
+    try:
+        yield format_event(retry=stream_settings['RETRY_MILLISECONDS'])
+        # Subscribed first, so rates stored while the snapshot is read are pushed right after it
+        for update in await sync_to_async(latest_rate_updates)(source_currency_code, target_currency_codes):
+            yield format_event('rate', update)
+
+        while not subscription.closed:
+            updates = await subscription.get(stream_settings['HEARTBEAT_SECONDS'])
+            for update in updates:
+                yield format_event('rate', update)
+            if not updates and not subscription.closed:
+                yield ': heartbeat\n\n'
+
+        # Too far behind: the client reconnects and starts over from the latest rates
+        yield format_event('close', {'reason': 'slow consumer'})
+    finally:
+        broker.unsubscribe(subscription)
+
+
+class RateStreamView(APIView):
+    """
+    API pushing exchange rates of a source currency as Server-Sent Events as soon
+    as they are stored, replacing client polling. Requires an ASGI server.
+    """
+    renderer_classes = [FastJSONRenderer, EventStreamRenderer]
+
+    def get(self, request):
+        source_currency_code = request.GET.get('source_currency', 'EUR')
+        target_currency_codes = sorted({code.strip() for code in request.GET.get('target_currencies', '').split(',')
+                                        if code.strip()})
+
+        if not isinstance(request._request, ASGIRequest):
+            return Response({'error': 'Live rates are only available when served through ASGI'},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        if currency_id(source_currency_code) is None:
+            return Response({'error': 'Invalid source currency'}, status=status.HTTP_400_BAD_REQUEST)
+        unknown = [code for code in target_currency_codes if currency_id(code) is None]
+        if unknown:
+            return Response({'error': f"Invalid target currencies: {', '.join(unknown)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(rate_events(source_currency_code, target_currency_codes),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+        return response
+
+class BulkWriteMixin:
+    """
+    Adds `<prefix>/bulk` to a model viewset: POST creates and PATCH updates a list of
+    objects in one transaction with `bulk_create`/`bulk_update`. Ids and the unique
+    field are checked with one query for the whole list, and a single
+    `reference_data_changed` is sent per call instead of a signal per row.
+    """
+    bulk_serializer_class = None
+    unique_field = None
+
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        try:
+            if not isinstance(request.data, list) or not request.data:
+                return Response({'error': 'Expected a non-empty list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+
+            updating = request.method == 'PATCH'
+            serializer = self.bulk_serializer_class(data=request.data, many=True, partial=updating)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            items = serializer.validated_data
+            model = self.queryset.model
+
+            if updating:
+                if any('id' not in item for item in items):
+                    return Response({'error': 'Every object needs an id'}, status=status.HTTP_400_BAD_REQUEST)
+                objects = model.objects.in_bulk([item['id'] for item in items])
+                unknown = [str(item['id']) for item in items if item['id'] not in objects]
+                if unknown:
+                    return Response({'error': f"Unknown ids: {', '.join(unknown)}"}, status=status.HTTP_404_NOT_FOUND)
+            else:
+                items = [{key: value for key, value in item.items() if key != 'id'} for item in items]
+
+            error = self.check_unique(model, items)
+            if error:
+                return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+            with transaction.atomic():
+                if updating:
+                    fields = sorted({key for item in items for key in item if key != 'id'})
+                    changed = []
+                    for item in items:
+                        instance = objects[item['id']]
+                        for key, value in item.items():
+                            setattr(instance, key, value)
+                        changed.append(instance)
+                    if fields:
+                        model.objects.bulk_update(changed, fields)
+                else:
+                    changed = model.objects.bulk_create([model(**item) for item in items])
+                reference_data_changed.send(sender=model)
+
+            return Response(self.get_serializer(changed, many=True).data,
+                            status=status.HTTP_200_OK if updating else status.HTTP_201_CREATED)
+        except IntegrityError:
+            # E.g. a concurrent request took a value after `check_unique`
+            return Response({'error': f'{self.unique_field} conflicts with stored objects'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def check_unique(self, model, items):
+        """
+        Checks the unique field against the list itself and, in one query, against stored objects.
+
+        :return: Error message or None
+        """
+        values = [item[self.unique_field] for item in items if self.unique_field in item]
+        if not values:
+            return None
+        duplicates = sorted({value for value in values if values.count(value) > 1})
+        if duplicates:
+            return f"Duplicate {self.unique_field}: {', '.join(duplicates)}"
+
+        # A value may only stay on the object holding it. Swaps between objects of the
+        # request are rejected too: `bulk_update` would hit the unique constraint mid-way.
+        assigned = {item[self.unique_field]: item.get('id') for item in items if self.unique_field in item}
+        taken = model.objects.filter(**{f'{self.unique_field}__in': values}).values_list('id', self.unique_field)
+        existing = sorted(value for object_id, value in taken if assigned[value] != object_id)
+        if existing:
+            return f"{self.unique_field} already exists: {', '.join(existing)}"
+        return None
+
+class CurrencyViewSet(BulkWriteMixin, viewsets.ModelViewSet):
+    """
+    CRUD API for managing available currencies, with bulk create/update.
     """
     queryset = Currency.objects.all()
     serializer_class = CurrencySerializer
+    bulk_serializer_class = CurrencyBulkSerializer
+    unique_field = 'code'
 
-class ProviderViewSet(viewsets.ModelViewSet):
+class ProviderViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     """
-    API for managing providers (activation, deactivation, priority update).
+    API for managing providers (activation, deactivation, priority update), with bulk create/update.
     """
     queryset = Provider.objects.all()
     serializer_class = ProviderSerializer
+    bulk_serializer_class = ProviderBulkSerializer
+    unique_field = 'name'
 
     def update(self, request, pk=None):
         """
@@ -184,9 +443,19 @@ class LoadHistoricalRatesView(APIView):
             if not all([start_date, end_date]):
                 return Response({'error': 'Missing required parameters'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Trigger Celery task to load historical exchange rates
+            # Trigger Celery task to load historical exchange rates. Celery and the tasks are imported
+            # on first use rather than at startup of every web worker.
+            from .tasks import load_historical_exchange_rates
             task = load_historical_exchange_rates.delay(start_date, end_date)
 
             return Response({'message': 'Historical exchange rate loading started', 'task_id': task.id}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class MetricsView(View):
+    """
+    Exposes application metrics in the Prometheus text format.
+    """
+    def get(self, request):
+        return HttpResponse(METRICS_REGISTRY.expose(), content_type=METRICS_CONTENT_TYPE)